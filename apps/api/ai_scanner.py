@@ -2,14 +2,21 @@
 AI-powered compliance scanning using OpenAI GPT models.
 Analyzes evidence documents against compliance requirements.
 """
+import asyncio
+import functools
 import json
 import logging
 import os
-from typing import List, Dict, Any, Optional
-from openai import OpenAI
+import random
+import time
+from typing import List, Dict, Any, Optional, Protocol, Callable
+import httpx
+import orjson
+from openai import OpenAI, AsyncOpenAI
 from pydantic import BaseModel, Field
 from models import Control, Requirement, Settings
 from database import SessionLocal
+from middleware import AIProcessingError
 
 logger = logging.getLogger(__name__)
 
@@ -18,7 +25,7 @@ logger = logging.getLogger(__name__)
 # The OpenAI SDK requires an api_key parameter, so we provide this dummy value for local endpoints.
 LOCAL_AI_PLACEHOLDER_KEY = os.getenv('LOCAL_AI_PLACEHOLDER_KEY', 'sk-local-endpoint-no-auth')
 
-def create_chat_completion_safe(client, model, messages, temperature=None):
+def create_chat_completion_safe(client, model, messages, max_tokens=None, temperature=None, use_json_mode=False):
     """
     Create a chat completion with safe fallbacks for different endpoint capabilities.
     Some OpenAI-compatible endpoints don't support all features.
@@ -30,10 +37,22 @@ def create_chat_completion_safe(client, model, messages, temperature=None):
     }
     
     # Add optional parameters
+    if max_tokens is not None:
+        params["max_tokens"] = max_tokens
     if temperature is not None:
         params["temperature"] = temperature
     
-    # Make request - LM Studio and similar don't support JSON mode
+    # Try with JSON mode first if requested
+    if use_json_mode:
+        try:
+            params["response_format"] = {"type": "json_object"}
+            return client.chat.completions.create(**params)
+        except Exception as e:
+            # LM Studio and similar don't support JSON mode, try without it
+            logger.warning(f"JSON mode not supported, falling back to text mode: {e}")
+            params.pop("response_format", None)
+    
+    # Make request without JSON mode
     return client.chat.completions.create(**params)
 
 # Initialize OpenAI client lazily
@@ -71,7 +90,6 @@ def get_vision_clients_for_dual_validation():
 
         # Get OpenAI GPT-4o client
         try:
-            from openai import OpenAI
             clients['openai'] = {
                 'client': OpenAI(
                     api_key=settings.openai_api_key,
@@ -111,8 +129,29 @@ def get_vision_clients_for_dual_validation():
     finally:
         db.close()
 
+# get_ai_client() is on every analysis path and resolves settings from the database (plus an
+# Ollama reachability probe), so the resolved client is reused for a short TTL.
+AI_CLIENT_TTL_SECONDS = float(os.getenv('AI_CLIENT_TTL_SECONDS', '30'))
+_ai_client_cache: Optional[tuple] = None
+
 def get_ai_client():
-    """Get AI client based on configured provider from database."""
+    """Get AI client based on configured provider, reusing the last one for AI_CLIENT_TTL_SECONDS."""
+    global _ai_client_cache
+    cached = _ai_client_cache
+    now = time.monotonic()
+    if cached is not None and now - cached[0] < AI_CLIENT_TTL_SECONDS:
+        return cached[1]
+    client = _build_ai_client()
+    _ai_client_cache = (now, client)
+    return client
+
+def invalidate_ai_client():
+    """Drop the cached AI client so the next call picks up changed settings."""
+    global _ai_client_cache
+    _ai_client_cache = None
+
+def _build_ai_client():
+    """Build AI client based on configured provider from database."""
     db = SessionLocal()
     try:
         # Get settings from database
@@ -143,7 +182,6 @@ def get_ai_client():
                 api_key = LOCAL_AI_PLACEHOLDER_KEY
 
             try:
-                from openai import OpenAI
                 return OpenAI(api_key=api_key, base_url=base_url)
             except Exception as e:
                 logger.error(f"Failed to initialize OpenAI client: {e}")
@@ -180,6 +218,186 @@ def get_openai_client():
     """Legacy function for backward compatibility."""
     return get_ai_client()
 
+# Shared HTTP client for Ollama so requests reuse pooled keep-alive connections; endpoints
+# behind TLS negotiate HTTP/2 and multiplex concurrent generations over one connection
+ollama_http = httpx.AsyncClient(
+    http2=True,
+    timeout=httpx.Timeout(60.0),
+    limits=httpx.Limits(max_connections=128, max_keepalive_connections=32)
+)
+
+# Request bodies are pre-encoded with orjson and sent as content=, so the type is set by hand
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+# Failures where Ollama never started generating; a read timeout means it did and is just slow
+_RETRYABLE_HTTP_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError)
+
+async def _with_retries(request_factory, attempts: int = 3, base: float = 0.25) -> httpx.Response:
+    """
+    Send an HTTP request, retrying transient failures with exponential backoff and jitter.
+    Connection failures and 5xx responses are retried; read timeouts propagate and 4xx
+    responses are returned as-is.
+    """
+    for attempt in range(attempts):
+        last_attempt = attempt == attempts - 1
+        try:
+            response = await request_factory()
+        except _RETRYABLE_HTTP_ERRORS as e:
+            if last_attempt:
+                raise
+            logger.warning(f"Transient HTTP error (attempt {attempt + 1}/{attempts}): {e}")
+        else:
+            if response.status_code < 500 or last_attempt:
+                return response
+            logger.warning(f"Upstream returned {response.status_code} (attempt {attempt + 1}/{attempts})")
+        await asyncio.sleep(base * 2 ** attempt + random.random() * base)
+
+async def aclose_http_client():
+    """Close the shared Ollama HTTP client (called on API shutdown)."""
+    await ollama_http.aclose()
+
+class AIProvider(Protocol):
+    """
+    Uniform text-completion interface over the configured AI backend.
+    Providers that stream may call stop_when with the text received so far and return
+    its result early when it is not None; others return the full response.
+    """
+    model: str
+
+    async def complete(self, prompt: str, max_tokens: Optional[int] = None, temperature: Optional[float] = None,
+                       system: Optional[str] = None, json_mode: bool = False, timeout: float = 60.0,
+                       stop_when: Optional[Callable[[str], Optional[str]]] = None) -> str:
+        ...
+
+class OllamaProvider:
+    """Text completions through Ollama's /api/generate endpoint."""
+
+    def __init__(self, endpoint: str, model: str, num_ctx: Optional[int] = None, max_tokens: Optional[int] = None):
+        self.endpoint = endpoint
+        self.model = model
+        self.num_ctx = num_ctx or int(os.getenv("OLLAMA_CONTEXT_SIZE", "32768"))
+        # Upper bound on generated tokens for every request sent through this provider
+        self.max_tokens = max_tokens
+
+    async def complete(self, prompt: str, max_tokens: Optional[int] = None, temperature: Optional[float] = None,
+                       system: Optional[str] = None, json_mode: bool = False, timeout: float = 60.0,
+                       stop_when: Optional[Callable[[str], Optional[str]]] = None) -> str:
+        if self.max_tokens is not None:
+            max_tokens = min(max_tokens, self.max_tokens) if max_tokens is not None else self.max_tokens
+
+        payload = {
+            "model": self.model,
+            "prompt": prompt,
+            "stream": False,
+            "options": {
+                "temperature": temperature,
+                "num_predict": max_tokens,
+                "num_ctx": self.num_ctx
+            }
+        }
+        if system:
+            payload["system"] = system
+        if json_mode:
+            # Ollama's grammar-constrained JSON output: generation ends when the object closes
+            payload["format"] = "json"
+        response = await _with_retries(
+            lambda: ollama_http.post(
+                f"{self.endpoint}/api/generate",
+                content=orjson.dumps(payload),
+                headers=JSON_HEADERS,
+                timeout=timeout
+            )
+        )
+
+        if response.status_code != 200:
+            raise AIProcessingError(f"Ollama API error: {response.status_code} - {response.text}")
+
+        result = response.json()
+        ai_response = result.get('response', '')
+
+        # Check thinking field if response is empty (some models use this field)
+        if not ai_response and 'thinking' in result:
+            ai_response = result.get('thinking', '')
+
+        return ai_response
+
+@functools.lru_cache(maxsize=8)
+def get_async_openai_client(api_key: str, base_url: Optional[str]) -> AsyncOpenAI:
+    """Shared AsyncOpenAI client per credentials/endpoint so its connection pool is reused."""
+    return AsyncOpenAI(api_key=api_key, base_url=base_url)
+
+class OpenAIProvider:
+    """Text completions through an OpenAI or OpenAI-compatible chat endpoint."""
+
+    def __init__(self, client: OpenAI, model: str):
+        self.client = client
+        self.async_client = get_async_openai_client(client.api_key, str(client.base_url))
+        self.model = model
+
+    async def complete(self, prompt: str, max_tokens: Optional[int] = None, temperature: Optional[float] = None,
+                       system: Optional[str] = None, json_mode: bool = False, timeout: float = 60.0,
+                       stop_when: Optional[Callable[[str], Optional[str]]] = None) -> str:
+        messages = [{"role": "system", "content": system}] if system else []
+        messages.append({"role": "user", "content": prompt})
+
+        params = {"model": self.model, "messages": messages, "timeout": timeout}
+        if max_tokens is not None:
+            params["max_tokens"] = max_tokens
+        if temperature is not None:
+            params["temperature"] = temperature
+        if stop_when is not None:
+            params["stream"] = True
+
+        if json_mode:
+            try:
+                response = await self.async_client.chat.completions.create(
+                    response_format={"type": "json_object"}, **params
+                )
+            except Exception as e:
+                # LM Studio and similar don't support JSON mode, try without it
+                logger.warning(f"JSON mode not supported, falling back to text mode: {e}")
+                response = await self.async_client.chat.completions.create(**params)
+        else:
+            response = await self.async_client.chat.completions.create(**params)
+
+        if stop_when is None:
+            return response.choices[0].message.content
+
+        parts = []
+        try:
+            async for chunk in response:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if not delta:
+                    continue
+                parts.append(delta)
+                # Only closing brackets can complete the structure the caller is waiting for
+                if '}' in delta or ']' in delta:
+                    early_result = stop_when("".join(parts))
+                    if early_result is not None:
+                        return early_result
+        finally:
+            await response.close()
+        return "".join(parts)
+
+def get_fast_ai_provider(provider: AIProvider) -> Optional[AIProvider]:
+    """
+    Small first-pass model (OLLAMA_FAST_MODEL, e.g. a Q4_K_M 1-3B model) on the same Ollama
+    endpoint as the given provider, or None when no fast tier applies.
+    """
+    fast_model = os.getenv("OLLAMA_FAST_MODEL")
+    if not fast_model or not isinstance(provider, OllamaProvider) or fast_model == provider.model:
+        return None
+    return OllamaProvider(provider.endpoint, fast_model, provider.num_ctx, max_tokens=400)
+
+def get_ai_provider() -> AIProvider:
+    """Get the configured AI backend wrapped as an AIProvider."""
+    ai_client = get_ai_client()
+    if isinstance(ai_client, dict) and ai_client.get('type') == 'ollama':
+        return OllamaProvider(ai_client['endpoint'], ai_client['model'])
+    return OpenAIProvider(ai_client, os.getenv("OPENAI_MODEL", "gpt-4o-mini"))
+
 class Citation(BaseModel):
     """Citation reference to evidence in documents."""
     document_id: str = Field(description="ID of the document containing the evidence")
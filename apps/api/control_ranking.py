@@ -0,0 +1,59 @@
+"""
+Lexical ranking of compliance controls against document text (Okapi BM25), used to
+shortlist the controls sent to the LLM.
+"""
+import heapq
+import math
+import re
+from collections import Counter
+from operator import itemgetter
+from typing import List
+
+STOPWORDS = frozenset(
+    "an and are as at be by for from has have in is it its of on or that the this to was were will with".split()
+)
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase alphanumeric tokens of two or more characters, minus common stopwords."""
+    return [
+        token for token in re.findall(r"[a-z0-9]+", text.lower())
+        if len(token) > 1 and token not in STOPWORDS
+    ]
+
+class BM25Index:
+    """Okapi BM25 over control text, used to shortlist controls before prompting the LLM."""
+
+    def __init__(self, documents: List[str], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.term_freqs = [Counter(tokenize(document)) for document in documents]
+        self.doc_lens = [sum(freqs.values()) for freqs in self.term_freqs]
+        self.avgdl = (sum(self.doc_lens) / len(self.doc_lens)) if self.doc_lens else 0.0
+        doc_freq = Counter(term for freqs in self.term_freqs for term in freqs)
+        n = len(documents)
+        self.idf = {term: math.log(1 + (n - count + 0.5) / (count + 0.5)) for term, count in doc_freq.items()}
+
+    def top_n(self, query: str, n: int) -> List[int]:
+        """Indices of the n best-scoring documents that share at least one term with the query."""
+        query_terms = [term for term in set(tokenize(query)) if term in self.idf]
+        if not query_terms:
+            return []
+        scores = []
+        for i, (freqs, doc_len) in enumerate(zip(self.term_freqs, self.doc_lens)):
+            norm = self.k1 * (1 - self.b + self.b * doc_len / self.avgdl) if self.avgdl else self.k1
+            score = 0.0
+            for term in query_terms:
+                tf = freqs.get(term)
+                if tf:
+                    score += self.idf[term] * tf * (self.k1 + 1) / (tf + norm)
+            if score > 0:
+                scores.append((score, i))
+        # Equal scores keep document order rather than favouring the later control
+        return [i for _, i in heapq.nlargest(n, scores, key=itemgetter(0))]
+
+def shortlist_controls(control_lines: tuple, controls_index: BM25Index, file_text: str, size: int) -> tuple:
+    """Table lines of up to size controls most likely to match the document; the first 50 if nothing matches."""
+    ranked = controls_index.top_n(file_text[:5000], size)
+    if not ranked:
+        return control_lines[:50]
+    return tuple(control_lines[i] for i in ranked)
@@ -7,7 +7,7 @@ import time
 from sqlalchemy import text, create_engine
 from sqlalchemy.orm import sessionmaker
 from database import engine, SessionLocal
-from models import Base, Framework
+from models import Base, Framework, Org, User
 from seed_data import seed_essential_eight
 
 logger = logging.getLogger(__name__)
@@ -80,6 +80,28 @@ def run_initial_seed():
             pass
         return False
 
+def ensure_demo_org_user():
+    """Create the demo organization and user that uploads are attributed to, if missing."""
+    db = SessionLocal()
+    try:
+        org = db.query(Org).first()
+        if not org:
+            org = Org(name="Demo Organization")
+            db.add(org)
+            db.flush()
+        
+        if not db.query(User).filter(User.org_id == org.id).first():
+            db.add(User(org_id=org.id, email="demo@example.com", name="Demo User"))
+        
+        db.commit()
+        return True
+    except Exception as e:
+        logger.error(f"Error creating demo organization and user: {e}")
+        db.rollback()
+        return False
+    finally:
+        db.close()
+
 def initialize_database():
     """
     Main database initialization function.
@@ -106,6 +128,11 @@ def initialize_database():
     else:
         logger.info("Database already contains data, skipping seed")
     
+    # Uploads are attributed to a demo org/user, so make sure they exist before serving requests
+    if not ensure_demo_org_user():
+        logger.error("Failed to create demo organization and user")
+        return False
+    
     logger.info("Database initialization completed successfully")
     return True
 
@@ -0,0 +1,139 @@
+"""
+Helpers for pulling JSON out of LLM replies that may wrap it in prose, code fences or
+trailing text, or that are still being streamed.
+"""
+import logging
+from typing import Optional
+
+import orjson
+
+logger = logging.getLogger(__name__)
+
+def balanced_json_spans(text: str, start: int = 0):
+    """Yield (begin, end) spans of brace-balanced {...} regions in text, ignoring braces inside strings."""
+    begin = text.find('{', start)
+    while begin != -1:
+        depth = 0
+        in_string = False
+        escaped = False
+        for pos in range(begin, len(text)):
+            ch = text[pos]
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif ch == '\\':
+                    escaped = True
+                elif ch == '"':
+                    in_string = False
+            elif ch == '"':
+                in_string = True
+            elif ch == '{':
+                depth += 1
+            elif ch == '}':
+                depth -= 1
+                if depth == 0:
+                    yield begin, pos + 1
+                    break
+        else:
+            return  # Unbalanced through the end of the text
+        begin = text.find('{', begin + 1)
+
+def extract_json_content_only(response_text):
+    """Extract just the JSON object as a string, no parsing."""
+    if not response_text:
+        return None
+
+    # Clean the response first
+    response_text = response_text.strip()
+
+    # If it already looks like valid JSON, return it
+    if response_text.startswith('{') and response_text.endswith('}'):
+        return response_text
+
+    # Find the outermost JSON object by balancing braces
+    for begin, end in balanced_json_spans(response_text):
+        return response_text[begin:end].strip()
+
+    return None
+
+def extract_json_from_response(response_text):
+    """Extract JSON from a response that might contain extra text."""
+    if not response_text:
+        logger.warning("Empty response text for JSON extraction")
+        return None
+    
+    # Clean the response text
+    response_text = response_text.strip()
+    logger.info(f"Extracting JSON from response (length: {len(response_text)}): {response_text[:200]}...")
+    
+    # First, try to parse the entire response as JSON
+    try:
+        parsed = orjson.loads(response_text)
+        if isinstance(parsed, dict):
+            logger.info("Successfully parsed entire response as JSON")
+            return parsed
+    except orjson.JSONDecodeError:
+        pass
+    
+    # Skip any prose before a ```json fence, then try each brace-balanced object in turn
+    fence = response_text.find('```json')
+    for begin, end in balanced_json_spans(response_text, fence + 7 if fence != -1 else 0):
+        try:
+            parsed = orjson.loads(response_text[begin:end])
+        except orjson.JSONDecodeError:
+            continue
+        if isinstance(parsed, dict):
+            logger.info(f"Successfully extracted JSON object at offset {begin}")
+            return parsed
+    
+    # Last resort: try to extract just the JSON portion
+    try:
+        # Find first { and last }
+        start = response_text.find('{')
+        end = response_text.rfind('}')
+        if start >= 0 and end > start:
+            return orjson.loads(response_text[start:end+1])
+    except orjson.JSONDecodeError:
+        pass
+    
+    return None
+
+def closed_suggestions(text: str) -> Optional[str]:
+    """
+    Given a partially streamed JSON reply, return a complete JSON document ending with its
+    "suggestions" array once that array has closed, dropping whatever the model adds after it.
+    The whole array is kept so validation can discard malformed items and still rank every
+    valid one. Returns None while more text is needed.
+    """
+    key = text.find('"suggestions"')
+    start = text.find('[', key) if key != -1 else -1
+    if start == -1:
+        return None
+
+    depth = 0
+    in_string = False
+    escaped = False
+    for pos in range(start + 1, len(text)):
+        ch = text[pos]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == '\\':
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in '{[':
+            depth += 1
+        elif ch in '}]':
+            if depth:
+                depth -= 1
+                continue
+            candidate = text[:pos + 1] + '}'  # The suggestions array itself closed
+            try:
+                orjson.loads(candidate)
+            except orjson.JSONDecodeError:
+                return None  # Not a plain top-level "suggestions" object; wait for the full reply
+            return candidate
+    return None
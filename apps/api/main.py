@@ -1,32 +1,64 @@
+import io
 import os
 import uuid
 import json
+import base64
+import hashlib
+import tempfile
 import json as json_module
 import requests
+import httpx
 import logging
+import orjson
 import asyncio
+import time
+import re
+import heapq
+import functools
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import List, Optional, Any, Dict, cast
+from typing import List, Optional, Any, Dict, Iterator, cast, Annotated
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, File, UploadFile, Depends, HTTPException, BackgroundTasks, Form
+from operator import itemgetter
+from fastapi import FastAPI, File, UploadFile, Depends, HTTPException, BackgroundTasks, Form, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from middleware import (
     ErrorHandlingMiddleware, 
     SecurityHeadersMiddleware, 
     RequestValidationMiddleware, 
     RequestLoggingMiddleware,
+    start_access_log_listener,
+    stop_access_log_listener,
     BusinessLogicError,
     AIProcessingError,
     FileProcessingError
 )
-from sqlalchemy.orm import Session
-from sqlalchemy import or_
-from database import get_db
+from sqlalchemy.orm import Session, joinedload, selectinload
+from sqlalchemy import or_, func, exists, literal
+from database import get_db, SessionLocal
 from models import Document, Org, User, Framework, Control, Requirement, EvidenceLink, Scan, ScanResult, Gap, DocumentControlLink, DocumentPage, Settings
 from storage import storage
 from worker_tasks import extract_document_text, process_scan
-from pydantic import BaseModel
-from init_db import initialize_database
+from pydantic import BaseModel, ConfigDict, AfterValidator, ValidationError, Field
+from init_db import initialize_database, ensure_demo_org_user, wait_for_database
+from openai import OpenAI
+from text_extraction import ocr_image_bytes, extract_docx_preview
+from json_extract import extract_json_content_only, extract_json_from_response, closed_suggestions
+from control_ranking import BM25Index, shortlist_controls
+from ai_scanner import (
+    get_ai_client, get_ai_provider, get_vision_clients_for_dual_validation,
+    aclose_http_client, OpenAIProvider, ollama_http, get_fast_ai_provider,
+    invalidate_ai_client, JSON_HEADERS, get_async_openai_client
+)
+import fitz  # PyMuPDF
+import pdfplumber
+import docx
+import pytesseract
+from PIL import Image
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -37,20 +69,89 @@ logger = logging.getLogger(__name__)
 # The OpenAI SDK requires an api_key parameter, so we provide this dummy value for local endpoints.
 LOCAL_AI_PLACEHOLDER_KEY = os.getenv('LOCAL_AI_PLACEHOLDER_KEY', 'sk-local-endpoint-no-auth')
 
-def _analyze_document_two_step(file_text: str, filename: str, available_controls: List[dict], ai_client) -> List[dict]:
+class _TrackedExecutor(Executor):
+    """Wraps an executor and counts the jobs submitted to it that have not finished yet."""
+
+    def __init__(self, executor: Executor, max_workers: int):
+        self._executor = executor
+        self.max_workers = max_workers
+        self.in_flight = 0
+        # Done callbacks run on the executor's own threads
+        self._lock = threading.Lock()
+
+    def submit(self, fn, /, *args, **kwargs):
+        with self._lock:
+            self.in_flight += 1
+        try:
+            future = self._executor.submit(fn, *args, **kwargs)
+        except BaseException:
+            self._job_done(None)
+            raise
+        future.add_done_callback(self._job_done)
+        return future
+
+    def _job_done(self, _future) -> None:
+        with self._lock:
+            self.in_flight -= 1
+
+    @property
+    def queue_depth(self) -> int:
+        """Jobs waiting for a worker: everything in flight beyond the ones being run."""
+        return max(0, self.in_flight - self.max_workers)
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False) -> None:
+        self._executor.shutdown(wait=wait, cancel_futures=cancel_futures)
+
+def _tracked_pool(pool_class, max_workers: int, **kwargs) -> _TrackedExecutor:
+    return _TrackedExecutor(pool_class(max_workers=max_workers, **kwargs), max_workers)
+
+# Process pools start their workers from a forkserver: by the time the first job is
+# submitted this process already runs threads (thread pools, the access-log listener),
+# and forking it directly could copy a lock held by one of them.
+_PROCESS_POOL_CONTEXT = multiprocessing.get_context("forkserver")
+
+# Each CPU-heavy workload gets its own bounded executor (bulkhead) so a burst of
+# one kind cannot starve the others or the default threadpool used by sync routes.
+# Tesseract OCR runs in separate processes so a slow or crashing OCR job
+# cannot block the event loop or take down the API worker.
+_OCR_POOL = _tracked_pool(ProcessPoolExecutor, min(2, os.cpu_count() or 1), mp_context=_PROCESS_POOL_CONTEXT)
+
+# PIL resize/re-encode for vision requests
+_IMG_POOL = _tracked_pool(ThreadPoolExecutor, 2, thread_name_prefix="img")
+
+# PyMuPDF releases the GIL for much of its work, so threads are enough
+_PDF_POOL = _tracked_pool(ThreadPoolExecutor, 4, thread_name_prefix="pdf")
+
+# python-docx is pure-Python XML walking that holds the GIL, so larger Word files are
+# parsed in worker processes; below DOCX_PROCESS_MIN_BYTES the pickling round trip
+# costs more than the parse and the thread pool is used instead. Every uvicorn worker
+# has its own pool, so it is kept small (DOCX_PROCESS_WORKERS) like the OCR pool.
+DOCX_PROCESS_WORKERS = int(os.getenv("DOCX_PROCESS_WORKERS", "2"))
+_DOCX_POOL = _tracked_pool(ProcessPoolExecutor, DOCX_PROCESS_WORKERS, mp_context=_PROCESS_POOL_CONTEXT)
+DOCX_PROCESS_MIN_BYTES = 64 * 1024
+
+def _executor_queue_depths() -> Dict[str, int]:
+    """Number of jobs waiting for a worker in each bulkhead executor."""
+    return {
+        "img": _IMG_POOL.queue_depth,
+        "pdf": _PDF_POOL.queue_depth,
+        "ocr": _OCR_POOL.queue_depth,
+        "docx": _DOCX_POOL.queue_depth,
+    }
+
+async def _analyze_document_two_step(file_text: str, filename: str, available_controls: List[dict], ai_client) -> List[dict]:
     """
     Two-step document analysis:
     1. First scan and summarize the document
     2. Then map the summary to compliance controls
     """
     if isinstance(ai_client, dict) and ai_client.get('type') == 'ollama':
-        return _analyze_document_ollama_two_step(file_text, filename, available_controls, ai_client)
+        return await _analyze_document_ollama_two_step(file_text, filename, available_controls, ai_client)
     else:
         return _analyze_document_openai_two_step(file_text, filename, available_controls, ai_client)
 
-def _analyze_document_ollama_two_step(file_text: str, filename: str, available_controls: List[dict], ai_client: dict) -> List[dict]:
+async def _analyze_document_ollama_two_step(file_text: str, filename: str, available_controls: List[dict], ai_client: dict) -> List[dict]:
     """JSON-to-JSON two-step analysis specifically for Ollama models"""
-    import requests
     import json as json_module
     
     endpoint = ai_client['endpoint']
@@ -67,9 +168,9 @@ Return JSON summary:
     
     try:
         # Use only generate API for completions
-        scan_response = requests.post(
+        scan_response = await ollama_http.post(
             f"{endpoint}/api/generate",
-            json={
+            content=orjson.dumps({
                 "model": model,
                 "prompt": scan_prompt,
                 "stream": False,
@@ -79,7 +180,8 @@ Return JSON summary:
                     "num_ctx": int(os.getenv("OLLAMA_CONTEXT_SIZE", "32768")),
                     "stop": ["\n\n\n"]  # Only stop on triple newlines
                 }
-            },
+            }),
+            headers=JSON_HEADERS,
             timeout=90
         )
         
@@ -104,7 +206,7 @@ Return JSON summary:
         logger.info(f"Step 1 raw response for {filename}: {document_summary_raw[:300]}...")
         
         # Parse the JSON summary from Step 1
-        document_summary_json = _extract_json_from_response(document_summary_raw)
+        document_summary_json = extract_json_from_response(document_summary_raw)
         if not document_summary_json:
             logger.warning(f"Step 1 failed to produce valid JSON for {filename}")
             return generate_fallback_suggestions_from_filename(filename, available_controls)
@@ -131,9 +233,9 @@ Return control mapping JSON:
         logger.info(f"Step 2: JSON mapping controls for {filename}")
         
         # Use only generate API for completions
-        mapping_response = requests.post(
+        mapping_response = await ollama_http.post(
             f"{endpoint}/api/generate",
-            json={
+            content=orjson.dumps({
                 "model": model,
                 "prompt": mapping_prompt,
                 "stream": False,
@@ -143,7 +245,8 @@ Return control mapping JSON:
                     "num_ctx": int(os.getenv("OLLAMA_CONTEXT_SIZE", "32768")),
                     "stop": ["\n\n\n"]  # Only stop on triple newlines
                 }
-            },
+            }),
+            headers=JSON_HEADERS,
             timeout=90
         )
         
@@ -168,7 +271,7 @@ Return control mapping JSON:
         logger.info(f"Step 2 raw response for {filename}: {mapping_text_raw}")
         
         # Parse the JSON mapping result from Step 2
-        mapping_json = _extract_json_from_response(mapping_text_raw)
+        mapping_json = extract_json_from_response(mapping_text_raw)
         if not mapping_json:
             logger.warning(f"Step 2 failed to produce valid JSON for {filename}")
             return generate_fallback_suggestions_from_filename(filename, available_controls)
@@ -299,129 +402,19 @@ def generate_fallback_suggestions_from_filename(filename: str, available_control
     # Return top 3 suggestions
     return sorted(suggestions, key=lambda x: x['confidence'], reverse=True)[:3]
 
-def _extract_json_content_only(response_text):
-    """Extract just the JSON object as a string, no parsing."""
-    if not response_text:
-        return None
-
-    import re
-
-    # Clean the response first
-    response_text = response_text.strip()
-
-    # If it already looks like valid JSON, return it
-    if response_text.startswith('{') and response_text.endswith('}'):
-        return response_text
-
-    # Try to find the outermost JSON object by counting braces
-    start_idx = response_text.find('{')
-    if start_idx == -1:
-        return None
-
-    brace_count = 0
-    end_idx = start_idx
-
-    for i in range(start_idx, len(response_text)):
-        if response_text[i] == '{':
-            brace_count += 1
-        elif response_text[i] == '}':
-            brace_count -= 1
-            if brace_count == 0:
-                end_idx = i + 1
-                break
-
-    if brace_count == 0 and end_idx > start_idx:
-        return response_text[start_idx:end_idx].strip()
-
-    return None
-
-def _extract_json_from_response(response_text):
-    """Extract JSON from a response that might contain extra text."""
-    if not response_text:
-        logger.warning("Empty response text for JSON extraction")
-        return None
-    
-    # Try to find JSON object in the response
-    import re
-    import json
-    
-    # Clean the response text
-    response_text = response_text.strip()
-    logger.info(f"Extracting JSON from response (length: {len(response_text)}): {response_text[:200]}...")
-    
-    # First, try to parse the entire response as JSON
-    try:
-        parsed = json.loads(response_text)
-        if isinstance(parsed, dict):
-            logger.info("Successfully parsed entire response as JSON")
-            return parsed
-    except json.JSONDecodeError:
-        pass
-    
-    # Look for JSON object patterns (more comprehensive)
-    json_patterns = [
-        r'\{[^{}]*"document_type"[^{}]*\}',  # Document summary JSON
-        r'\{[^{}]*"selected_control_number"[^{}]*\}',  # Control mapping JSON
-        r'\{[^{}]*"suggestions"[^{}]*\[[^\]]*\][^{}]*\}',  # Suggestions JSON
-        r'\{.*?"suggestions".*?\[.*?\].*?\}',  # More flexible suggestions pattern
-        r'\{[\s\S]*?\}',  # Any JSON object (non-greedy)
-    ]
-    
-    for i, pattern in enumerate(json_patterns):
-        matches = re.findall(pattern, response_text, re.DOTALL)
-        for match in matches:
-            try:
-                # Clean the match
-                cleaned_match = match.strip()
-                parsed = json.loads(cleaned_match)
-                if isinstance(parsed, dict):
-                    logger.info(f"Successfully extracted JSON using pattern {i}: {cleaned_match[:100]}...")
-                    return parsed
-            except json.JSONDecodeError:
-                continue
-    
-    # Try to find JSON between code block markers
-    code_block_patterns = [
-        r'```json\s*(\{.*?\})\s*```',
-        r'```\s*(\{.*?\})\s*```',
-    ]
-    
-    for pattern in code_block_patterns:
-        matches = re.findall(pattern, response_text, re.DOTALL)
-        for match in matches:
-            try:
-                parsed = json.loads(match.strip())
-                if isinstance(parsed, dict):
-                    return parsed
-            except json.JSONDecodeError:
-                continue
-    
-    # Try the whole response as-is
-    try:
-        return json.loads(response_text)
-    except json.JSONDecodeError:
-        pass
-    
-    # Last resort: try to extract just the JSON portion
-    try:
-        # Find first { and last }
-        start = response_text.find('{')
-        end = response_text.rfind('}')
-        if start >= 0 and end > start:
-            json_portion = response_text[start:end+1]
-            return json.loads(json_portion)
-    except (json.JSONDecodeError, ValueError):
-        pass
-    
-    return None
-
 def _safe_json_loads(json_data, default=None):
-    """Safely parse JSON data from JSONB columns, which are already parsed by PostgreSQL."""
+    """Safely parse JSON data from JSONB columns (already parsed by the driver) or TEXT columns."""
     if json_data is None:
         return default
 
+    # Databases created from the TEXT-column migration hand back the raw JSON document
+    if isinstance(json_data, str) and json_data[:1] in ('[', '{', '"'):
+        try:
+            json_data = orjson.loads(json_data)
+        except orjson.JSONDecodeError:
+            pass
+
     # JSONB columns return already-parsed Python objects (str, list, dict)
-    # Just return them directly - no JSON parsing needed
     if isinstance(json_data, (str, list, dict)):
         return json_data if json_data else default
 
@@ -429,24 +422,46 @@ def _safe_json_loads(json_data, default=None):
     logger.warning(f"Unexpected data type in database - returning default. Type: {type(json_data)}, Content: {str(json_data)[:100]}...")
     return default
 
+# Schema creation and seeding on API startup; disable when replicas share an init job
+RUN_DB_INIT = os.getenv("RUN_DB_INIT", "true").lower() in ("1", "true", "yes")
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     logger.info("Starting GeekyGoose Compliance API...")
     
-    # Initialize database on startup
-    if not initialize_database():
-        logger.error("Database initialization failed!")
-        raise RuntimeError("Database initialization failed")
+    # Initialize database on startup, unless a one-shot `python init_db.py` job has already
+    # done it (RUN_DB_INIT=false); then only check that the database is reachable
+    if RUN_DB_INIT:
+        if not initialize_database():
+            logger.error("Database initialization failed!")
+            raise RuntimeError("Database initialization failed")
+    elif not wait_for_database():
+        raise RuntimeError("Database is not available")
     
     # Start the periodic AI retry task
     retry_task = asyncio.create_task(periodic_ai_retry_task())
     logger.info("Started periodic AI retry task")
     
+    # Resolve the AI client once up front so the first upload doesn't pay for it
+    try:
+        await asyncio.to_thread(get_ai_client)
+    except Exception as e:
+        logger.warning(f"AI client not available at startup: {e}")
+    
+    # Access log lines are written from a background thread from here on
+    start_access_log_listener()
+    
     logger.info("GeekyGoose Compliance API startup complete")
     yield
     # Shutdown
     logger.info("GeekyGoose Compliance API shutting down...")
+    _OCR_POOL.shutdown(wait=False, cancel_futures=True)
+    _IMG_POOL.shutdown(wait=False, cancel_futures=True)
+    _PDF_POOL.shutdown(wait=False, cancel_futures=True)
+    _DOCX_POOL.shutdown(wait=False, cancel_futures=True)
+    await aclose_http_client()
+    stop_access_log_listener()
     retry_task.cancel()
     try:
         await retry_task
@@ -457,7 +472,8 @@ app = FastAPI(
     title="GeekyGoose Compliance API",
     description="Compliance automation platform for SMB + internal IT teams",
     version="0.3.0",  # Updated version
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 # Add security and error handling middleware (order matters!)
@@ -489,8 +505,100 @@ ALLOWED_MIME_TYPES = {
     "image/jpeg"
 }
 
+ALLOWED_MIME_TYPES_STR = ', '.join(sorted(ALLOWED_MIME_TYPES))
+
 MAX_FILE_SIZE = 50 * 1024 * 1024  # 50MB
 
+# Cap for files sent straight to AI analysis (read into memory per request)
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(25 * 1024 * 1024)))
+UPLOAD_READ_CHUNK = 1024 * 1024
+
+# Plain-text previews sent to the model are at most a few KB
+TEXT_PREVIEW_BYTES = 16 * 1024
+FULL_READ_MIME_TYPES = {
+    "application/pdf",
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+}
+
+async def _read_capped(file: UploadFile, limit: int = MAX_UPLOAD_BYTES) -> bytes:
+    """Read an upload in chunks, rejecting it with 413 as soon as it exceeds the limit."""
+    buffer = bytearray()
+    while chunk := await file.read(UPLOAD_READ_CHUNK):
+        buffer += chunk
+        if len(buffer) > limit:
+            raise HTTPException(
+                status_code=413,
+                detail=f"File too large. Maximum size: {limit // (1024*1024)}MB"
+            )
+    return bytes(buffer)
+
+# Document uploads are spooled to disk past this size instead of being held in memory
+UPLOAD_SPOOL_MAX_MEMORY = 8 * 1024 * 1024
+
+def _copy_to_spool(source, limit: int) -> tuple:
+    """Blocking half of _spool_upload: copy through one reused buffer, so no per-chunk bytes are allocated."""
+    hasher = hashlib.sha256()
+    size = 0
+    spool = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_MAX_MEMORY)
+    buffer = bytearray(UPLOAD_READ_CHUNK)
+    view = memoryview(buffer)
+    try:
+        while n := source.readinto(buffer):
+            size += n
+            if size > limit:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"File too large. Maximum size: {limit // (1024*1024)}MB"
+                )
+            chunk = view[:n]
+            hasher.update(chunk)
+            spool.write(chunk)
+    except BaseException:
+        spool.close()
+        raise
+    spool.seek(0)
+    return spool, hasher.hexdigest(), size
+
+async def _spool_upload(file: UploadFile, limit: int) -> tuple:
+    """
+    Copy an upload into a SpooledTemporaryFile in chunks, hashing it on the way and rejecting
+    it as soon as it exceeds limit. Returns (spooled file rewound to 0, sha256 hex, size).
+    """
+    # The request body is already spooled by the form parser, so the copy only does file I/O
+    return await asyncio.to_thread(_copy_to_spool, file.file, limit)
+
+class _TTLCache:
+    """LRU cache with per-entry expiry. Only touched from the event loop, so no locking is needed."""
+
+    def __init__(self, capacity: int, ttl: float):
+        self.capacity = capacity
+        self.ttl = ttl
+        self._entries: OrderedDict = OrderedDict()
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key, value) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+
+# Control suggestions keyed by document text + candidate controls + model, so re-uploads skip the LLM
+SUGGESTION_CACHE_ENABLED = os.getenv("SUGGESTION_CACHE_ENABLED", "true").lower() == "true"
+_suggestion_cache = _TTLCache(
+    capacity=int(os.getenv("SUGGESTION_CACHE_CAPACITY", "10000")),
+    ttl=float(os.getenv("SUGGESTION_CACHE_TTL", "3600"))
+)
+
 async def analyze_file_content_for_controls(file: UploadFile, file_content: bytes) -> list:
     """Analyze file content and suggest relevant compliance controls."""
     try:
@@ -553,8 +661,6 @@ async def analyze_file_content_for_controls(file: UploadFile, file_content: byte
                 
         elif file_mime == "application/pdf" or file.content_type == "application/pdf" or filename.lower().endswith('.pdf'):
             try:
-                import fitz  # PyMuPDF
-                import pdfplumber
                 
                 # Try PyMuPDF first (faster)
                 try:
@@ -570,7 +676,6 @@ async def analyze_file_content_for_controls(file: UploadFile, file_content: byte
                     file_text = " ".join(text_pages)
                 except Exception:
                     # Fallback to pdfplumber for more complex PDFs
-                    import io
                     with pdfplumber.open(io.BytesIO(file_content)) as pdf:
                         text_pages = []
                         for i, page in enumerate(pdf.pages[:3]):
@@ -588,10 +693,6 @@ async def analyze_file_content_for_controls(file: UploadFile, file_content: byte
         elif (file_mime and file_mime.startswith("image/")) or (file.content_type and file.content_type.startswith("image/")) or filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp')):
             # Enhanced image processing with OCR fallback
             try:
-                from ai_scanner import get_ai_client
-                import base64
-                from PIL import Image
-                import io
                 
                 # Process image with PIL first
                 try:
@@ -620,7 +721,8 @@ async def analyze_file_content_for_controls(file: UploadFile, file_content: byte
                 
                 if not isinstance(ai_client, dict):  # OpenAI
                     try:
-                        response = ai_client.chat.completions.create(
+                        response = await asyncio.to_thread(
+                            ai_client.chat.completions.create,
                             model="gpt-4o",  # Updated to latest vision model
                             messages=[
                                 {
@@ -647,8 +749,6 @@ async def analyze_file_content_for_controls(file: UploadFile, file_content: byte
                         logger.warning(f"Vision AI failed for {filename}: {e}")
                         # Fallback to OCR
                         try:
-                            import pytesseract
-                            from PIL import Image
                             image = Image.open(io.BytesIO(file_content))
                             ocr_text = pytesseract.image_to_string(image)
                             if ocr_text.strip():
@@ -660,8 +760,6 @@ async def analyze_file_content_for_controls(file: UploadFile, file_content: byte
                 else:
                     # Try OCR for Ollama users
                     try:
-                        import pytesseract
-                        from PIL import Image
                         image = Image.open(io.BytesIO(file_content))
                         ocr_text = pytesseract.image_to_string(image)
                         if ocr_text.strip():
@@ -677,10 +775,8 @@ async def analyze_file_content_for_controls(file: UploadFile, file_content: byte
         elif file_mime == "application/vnd.openxmlformats-officedocument.wordprocessingml.document" or filename.lower().endswith('.docx'):
             # Enhanced Word document processing
             try:
-                from docx import Document
-                import io
                 
-                doc = Document(io.BytesIO(file_content))
+                doc = docx.Document(io.BytesIO(file_content))
                 paragraphs = []
                 for para in doc.paragraphs:
                     if para.text.strip():
@@ -805,14 +901,13 @@ Do not include any text before or after the JSON. Return empty suggestions array
         
         # Call AI for analysis using new two-step approach
         try:
-            from ai_scanner import get_ai_client
             logger.info(f"Attempting to get AI client for {filename}")
             ai_client = get_ai_client()
             logger.info(f"AI client initialized: {type(ai_client)}")
             
             # Use the new two-step analysis approach
             logger.info(f"Starting two-step analysis for {filename}")
-            suggested_controls = _analyze_document_two_step(
+            suggested_controls = await _analyze_document_two_step(
                 file_text=file_text,
                 filename=filename,
                 available_controls=available_controls,
@@ -827,14 +922,13 @@ Do not include any text before or after the JSON. Return empty suggestions array
             
             # Fallback to original method if two-step fails
             if isinstance(ai_client, dict) and ai_client.get('type') == 'ollama':
-                import requests
                 endpoint = ai_client['endpoint']
                 model = ai_client['model']
                 logger.info(f"Using Ollama at {endpoint} with model {model}")
                 
                 # Test Ollama connectivity first
                 try:
-                    test_response = requests.get(f"{endpoint}/api/tags", timeout=10)
+                    test_response = await ollama_http.get(f"{endpoint}/api/tags", timeout=10)
                     logger.info(f"Ollama connectivity test: {test_response.status_code}")
                     if test_response.status_code != 200:
                         logger.error(f"Ollama not reachable at {endpoint}")
@@ -855,9 +949,9 @@ Respond with JSON only:
                 logger.info(f"Sending prompt to Ollama (length: {len(simple_prompt)})")
                 
                 # Use only generate API for completions
-                response = requests.post(
+                response = await ollama_http.post(
                     f"{endpoint}/api/generate",
-                    json={
+                    content=orjson.dumps({
                         "model": model,
                         "prompt": simple_prompt,
                         "stream": False,
@@ -869,7 +963,8 @@ Respond with JSON only:
                             "top_p": 0.9,
                             "repeat_penalty": 1.0,
                         }
-                    },
+                    }),
+                    headers=JSON_HEADERS,
                     timeout=60
                 )
                 
@@ -892,7 +987,7 @@ Respond with JSON only:
                         logger.info(f"Content empty, checking thinking field for JSON: '{thinking_content[:200]}...'")
                         
                         # Try to extract JSON from thinking field
-                        extracted_json = _extract_json_content_only(thinking_content)
+                        extracted_json = extract_json_content_only(thinking_content)
                         if extracted_json:
                             logger.info(f"Found valid JSON in thinking field, using it: {extracted_json}")
                             ai_response = extracted_json
@@ -907,7 +1002,7 @@ Respond with JSON only:
                     # Force clean JSON extraction if the response contains explanatory text
                     if ai_response and ("We need" in ai_response or "Looking at" in ai_response or "The document" in ai_response):
                         logger.warning(f"Response contains explanatory text, attempting JSON extraction")
-                        extracted_json = _extract_json_content_only(ai_response)
+                        extracted_json = extract_json_content_only(ai_response)
                         if extracted_json:
                             logger.info(f"Extracted JSON: {extracted_json}")
                             ai_response = extracted_json
@@ -924,7 +1019,7 @@ Respond with JSON only:
                     if not ai_response.strip().startswith('{') or not ai_response.strip().endswith('}'):
                         logger.warning(f"Response doesn't look like JSON for {filename}: {ai_response[:100]}")
                         # Try to extract any JSON from the response
-                        ai_response = _extract_json_content_only(ai_response)
+                        ai_response = extract_json_content_only(ai_response)
                         if not ai_response:
                             logger.error(f"No valid JSON found in response for {filename}")
                             return generate_fallback_suggestions_from_filename(filename, available_controls)
@@ -939,7 +1034,8 @@ Respond with JSON only:
                 try:
                     # First, test with a simple prompt to verify AI client works
                     logger.info(f"Testing AI connectivity with model: {model}")
-                    test_response = create_chat_completion_safe(
+                    test_response = await asyncio.to_thread(
+                        create_chat_completion_safe,
                         client=ai_client,
                         model=model,
                         messages=[
@@ -959,7 +1055,8 @@ Respond with JSON only:
                         return generate_fallback_suggestions_from_filename(filename, available_controls)
                     
                     # Now try the actual analysis
-                    response = create_chat_completion_safe(
+                    response = await asyncio.to_thread(
+                        create_chat_completion_safe,
                         client=ai_client,
                         model=model,
                         messages=[
@@ -989,7 +1086,8 @@ Available controls: {[c['code'] for c in available_controls[:5]]}
 Respond with ONLY this JSON structure:
 {{\"suggestions\": [{{\"control_code\": \"EXACT_CODE\", \"control_title\": \"Full title\", \"framework_name\": \"Framework\", \"confidence\": 0.7, \"reasoning\": \"brief explanation\"}}]}}"""
                         try:
-                            simple_response = create_chat_completion_safe(
+                            simple_response = await asyncio.to_thread(
+                                create_chat_completion_safe,
                                 client=ai_client,
                                 model=model,
                                 messages=[{"role": "user", "content": simple_prompt}],
@@ -1187,11 +1285,8 @@ async def retry_ai_processing():
             try:
                 logger.info(f"Retrying AI processing for document: {doc.id} - {doc.filename}")
                 
-                # Download the document content from storage
-                file_content = storage.download(doc.storage_key)
-                
-                # Process in background
-                await process_document_ai_analysis_background(str(doc.id), doc.filename, file_content)
+                # Process in background; it reads the document from storage itself
+                await process_document_ai_analysis_background(str(doc.id), doc.filename, doc.storage_key)
                 
             except Exception as e:
                 logger.error(f"Failed to retry AI processing for document {doc.id}: {e}")
@@ -1209,11 +1304,21 @@ async def periodic_ai_retry_task():
             logger.error(f"Error in periodic AI retry task: {e}")
             await asyncio.sleep(300)  # Wait 5 minutes before trying again
 
-async def process_document_ai_analysis_background(document_id: str, filename: str, file_content: bytes):
+# Background analysis only looks at the start of plain-text documents (a 2000 character
+# preview), so those are read from storage as a capped prefix; PDF, Word and image
+# parsing needs the whole file
+AI_ANALYSIS_TEXT_PREFIX_BYTES = 16 * 1024
+_WHOLE_FILE_SUFFIXES = ('.pdf', '.docx', '.png', '.jpg', '.jpeg')
+
+async def process_document_ai_analysis_background(document_id: str, filename: str, storage_key: str):
     """Process AI analysis in background and store results."""
     try:
         logger.info(f"Starting background AI analysis for document {document_id}: {filename}")
         
+        # Read only as much of the stored document as the analysis uses
+        max_bytes = None if filename.lower().endswith(_WHOLE_FILE_SUFFIXES) else AI_ANALYSIS_TEXT_PREFIX_BYTES
+        file_content = await asyncio.to_thread(storage.download_file, storage_key, max_bytes)
+        
         # Create a mock file object for the analysis
         class MockFile:
             def __init__(self, filename, content):
@@ -1295,7 +1400,6 @@ async def process_document_ai_analysis_background(document_id: str, filename: st
                 logger.info(f"Dual vision validation enabled for document {document_id}")
                 try:
                     # Re-analyze with both vision models
-                    from ai_scanner import get_vision_clients_for_dual_validation
                     vision_clients = get_vision_clients_for_dual_validation()
 
                     if len(vision_clients) >= 2:
@@ -1505,13 +1609,60 @@ def generate_essential_eight_suggestions_from_filename(filename: str, available_
     
     return suggestions
 
+# Health probes hit these constantly, so their bodies are encoded once
+_ROOT_BYTES = orjson.dumps({"message": "GeekyGoose Compliance API is running"})
+_HEALTH_BYTES = orjson.dumps({"status": "healthy"})
+
 @app.get("/")
 async def root():
-    return {"message": "GeekyGoose Compliance API is running"}
+    return Response(content=_ROOT_BYTES, media_type="application/json")
 
 @app.get("/health")
 async def health():
-    return {"status": "healthy"}
+    return Response(content=_HEALTH_BYTES, media_type="application/json")
+
+@app.get("/health/executors")
+async def executor_health():
+    """Report queue depth of the OCR, image, PDF and Word worker pools."""
+    return {"executor_queue_depth": _executor_queue_depths()}
+
+# (org_id, user_id) that uploads are attributed to; resolved once per process
+_demo_ids: Optional[tuple] = None
+
+def _get_demo_ids(db: Session) -> tuple:
+    """Ids of the demo org and user. They are created at startup by initialize_database()."""
+    global _demo_ids
+    if _demo_ids is None:
+        row = db.query(Org.id, User.id).join(User, User.org_id == Org.id).first()
+        if not row:
+            ensure_demo_org_user()
+            row = db.query(Org.id, User.id).join(User, User.org_id == Org.id).first()
+        _demo_ids = tuple(row)
+    return _demo_ids
+
+def _store_uploaded_document(db: Session, spool, filename: str, content_type: str, sha256_hash: str, file_size: int) -> Document:
+    """Upload a spooled document to storage and record it. Blocking."""
+    # Upload to storage
+    storage_key = storage.upload_stream(spool, filename, content_type)
+
+    org_id, user_id = _get_demo_ids(db)
+
+    # Save to database
+    document = Document(
+        org_id=org_id,
+        filename=filename,
+        mime_type=content_type,
+        storage_key=storage_key,
+        file_size=file_size,
+        uploaded_by=user_id,
+        sha256=sha256_hash
+    )
+
+    db.add(document)
+    db.commit()
+    db.refresh(document)
+
+    return document
 
 @app.post("/documents/upload")
 async def upload_document(
@@ -1522,60 +1673,19 @@ async def upload_document(
     if file.content_type not in ALLOWED_MIME_TYPES:
         raise HTTPException(
             status_code=400,
-            detail=f"File type {file.content_type} not allowed. Allowed types: {', '.join(ALLOWED_MIME_TYPES)}"
+            detail=f"File type {file.content_type} not allowed. Allowed types: {ALLOWED_MIME_TYPES_STR}"
         )
     
-    # Check file size
-    file_content = await file.read()
-    if len(file_content) > MAX_FILE_SIZE:
-        raise HTTPException(
-            status_code=400,
-            detail=f"File too large. Maximum size: {MAX_FILE_SIZE // (1024*1024)}MB"
-        )
-    
-    # Reset file position
-    await file.seek(0)
+    # Stream the body once, checking the size cap and hashing it as it arrives
+    spool, sha256_hash, file_size = await _spool_upload(file, MAX_FILE_SIZE)
     
     try:
-        # Upload to storage
-        storage_key, sha256_hash, file_size = storage.upload_file(
-            file.file, file.filename, file.content_type
-        )
-        
-        # For demo purposes, create a default org and user if they don't exist
-        org = db.query(Org).first()
-        if not org:
-            org = Org(id=uuid.uuid4(), name="Demo Organization")
-            db.add(org)
-            db.commit()
-            db.refresh(org)
-        
-        user = db.query(User).filter(User.org_id == org.id).first()
-        if not user:
-            user = User(
-                id=uuid.uuid4(),
-                org_id=org.id,
-                email="demo@example.com",
-                name="Demo User"
-            )
-            db.add(user)
-            db.commit()
-            db.refresh(user)
-        
-        # Save to database
-        document = Document(
-            org_id=org.id,
-            filename=file.filename,
-            mime_type=file.content_type,
-            storage_key=storage_key,
-            file_size=file_size,
-            uploaded_by=user.id,
-            sha256=sha256_hash
+        # Storage and database calls are blocking, so run them on the threadpool to
+        # let concurrent uploads proceed in parallel instead of queueing on the event loop
+        document = await asyncio.to_thread(
+            _store_uploaded_document, db, spool, file.filename, file.content_type, sha256_hash, file_size
         )
-        
-        db.add(document)
-        db.commit()
-        db.refresh(document)
+        storage_key = document.storage_key
 
         # Trigger text extraction task (required for compliance scanning)
         try:
@@ -1596,7 +1706,7 @@ async def upload_document(
             asyncio.create_task(process_document_ai_analysis_background(
                 document.id,
                 file.filename,
-                file_content
+                storage_key
             ))
             logger.info(f"Scheduled background AI analysis for {file.filename}")
         except Exception as e:
@@ -1605,7 +1715,7 @@ async def upload_document(
         # Provide immediate filename-based suggestion for quick feedback
         try:
             # Get available controls for immediate suggestions
-            controls = db.query(Control).all()
+            controls = await asyncio.to_thread(lambda: db.query(Control).all())
             available_controls = [
                 {
                     'code': control.code,
@@ -1637,15 +1747,26 @@ async def upload_document(
         logger.error(f"Upload failed for {file.filename if file else 'unknown file'}: {e}")
         logger.exception("Full upload error details:")
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
+    finally:
+        spool.close()
 
 @app.get("/documents")
-async def list_documents(db: Session = Depends(get_db)):
-    documents = db.query(Document).order_by(Document.created_at.desc()).all()
+async def list_documents(limit: Optional[int] = None, offset: int = 0, db: Session = Depends(get_db)):
+    """List documents newest first; pass limit/offset to page through large libraries."""
+    # Control links and their controls are batch-loaded instead of queried per document
+    query = db.query(Document).options(
+        selectinload(Document.control_links).selectinload(DocumentControlLink.control)
+    ).order_by(Document.created_at.desc())
+    if offset > 0:
+        query = query.offset(offset)
+    if limit is not None:
+        query = query.limit(max(1, min(limit, 500)))
+    documents = query.all()
     
     result = []
     for doc in documents:
         # Check if document has control links (AI processing complete)
-        links = db.query(DocumentControlLink).filter(DocumentControlLink.document_id == doc.id).all()
+        links = doc.control_links
         
         result.append({
             "id": str(doc.id),
@@ -1692,7 +1813,6 @@ async def download_document(document_id: str, db: Session = Depends(get_db)):
         
         logger.info(f"Retrieved file content, size: {len(file_content)} bytes")
         
-        from fastapi.responses import Response
         return Response(
             content=file_content,
             media_type=document.mime_type,
@@ -1804,7 +1924,6 @@ async def run_comprehensive_ai_analysis(request: dict, db: Session = Depends(get
             recommendations.append("Consider uploading more supporting documents for comprehensive compliance coverage.")
         
         # Run AI analysis on the overall compliance state
-        from ai_scanner import get_ai_client
         ai_client = get_ai_client()
         if ai_client and not isinstance(ai_client, dict):
             try:
@@ -1824,7 +1943,8 @@ async def run_comprehensive_ai_analysis(request: dict, db: Session = Depends(get
                 Focus on prioritization and practical next steps.
                 """
                 
-                ai_response = create_chat_completion_safe(
+                ai_response = await asyncio.to_thread(
+                    create_chat_completion_safe,
                     client=ai_client,
                     model=os.getenv("OPENAI_MODEL", "gpt-4o-mini"),
                     messages=[
@@ -1983,29 +2103,43 @@ async def list_frameworks(db: Session = Depends(get_db)):
 @app.get("/frameworks/{framework_id}/controls")
 async def list_controls(framework_id: str, db: Session = Depends(get_db)):
     """List all controls for a framework."""
-    controls = db.query(Control).filter(Control.framework_id == framework_id).all()
+    # Both counts are correlated subqueries so the whole list is one round trip
+    requirements_count = (
+        db.query(func.count(Requirement.id))
+        .filter(Requirement.control_id == Control.id)
+        .correlate(Control)
+        .scalar_subquery()
+    )
+    linked_docs_count = (
+        db.query(func.count(DocumentControlLink.id))
+        .filter(DocumentControlLink.control_id == Control.id)
+        .correlate(Control)
+        .scalar_subquery()
+    )
+    rows = (
+        db.query(Control, requirements_count, linked_docs_count)
+        .filter(Control.framework_id == framework_id)
+        .all()
+    )
     
     result = []
-    for control in controls:
-        requirements = db.query(Requirement).filter(Requirement.control_id == control.id).all()
-        # Count linked documents for this control
-        linked_docs_count = db.query(DocumentControlLink).filter(DocumentControlLink.control_id == control.id).count()
-        
+    for control, control_requirements_count, control_linked_docs_count in rows:
         result.append({
             "id": str(control.id),
             "code": control.code,
             "title": control.title,
             "description": control.description,
-            "requirements_count": len(requirements),
-            "linked_documents_count": linked_docs_count,
+            "requirements_count": control_requirements_count,
+            "linked_documents_count": control_linked_docs_count,
             "created_at": control.created_at.isoformat()
         })
     
     return {"controls": result}
 
-def get_control_by_id_or_code(db: Session, control_identifier: str) -> Control:
+def get_control_by_id_or_code(db: Session, control_identifier: str, *options) -> Control:
     """
     Find a control by either UUID or code (case-insensitive).
+    Extra loader options (e.g. joinedload) are applied to the lookup query.
     Returns the control or None if not found.
     """
     from uuid import UUID
@@ -2013,20 +2147,20 @@ def get_control_by_id_or_code(db: Session, control_identifier: str) -> Control:
     # Try to parse as UUID first
     try:
         uuid_obj = UUID(control_identifier)
-        control = db.query(Control).filter(Control.id == uuid_obj).first()
+        control = db.query(Control).options(*options).filter(Control.id == uuid_obj).first()
         if control:
             return control
     except (ValueError, AttributeError):
         pass
 
     # Try as code (case-insensitive)
-    control = db.query(Control).filter(Control.code.ilike(control_identifier)).first()
+    control = db.query(Control).options(*options).filter(Control.code.ilike(control_identifier)).first()
     return control
 
 @app.get("/controls/{control_id}")
 async def get_control_details(control_id: str, db: Session = Depends(get_db)):
     """Get detailed information about a specific control."""
-    control = get_control_by_id_or_code(db, control_id)
+    control = get_control_by_id_or_code(db, control_id, joinedload(Control.framework))
     if not control:
         raise HTTPException(status_code=404, detail="Control not found")
     
@@ -2061,36 +2195,31 @@ async def link_evidence_to_control(
 ):
     """Link a document as evidence for a control/requirement."""
     
-    # Verify document exists
-    document = db.query(Document).filter(Document.id == document_id).first()
-    if not document:
-        raise HTTPException(status_code=404, detail="Document not found")
+    # Verify the document, control and optional requirement exist and the link is new in one round trip
+    checks = db.query(
+        Document.org_id,
+        exists().where(Control.id == request.control_id),
+        exists().where(Requirement.id == request.requirement_id) if request.requirement_id else literal(True),
+        exists().where(
+            EvidenceLink.document_id == document_id,
+            EvidenceLink.control_id == request.control_id,
+            EvidenceLink.requirement_id == request.requirement_id
+        )
+    ).filter(Document.id == document_id).first()
     
-    # Verify control exists
-    control = db.query(Control).filter(Control.id == request.control_id).first()
-    if not control:
+    if not checks:
+        raise HTTPException(status_code=404, detail="Document not found")
+    org_id, control_exists, requirement_exists, link_exists = checks
+    if not control_exists:
         raise HTTPException(status_code=404, detail="Control not found")
-    
-    # Verify requirement exists if provided
-    requirement = None
-    if request.requirement_id:
-        requirement = db.query(Requirement).filter(Requirement.id == request.requirement_id).first()
-        if not requirement:
-            raise HTTPException(status_code=404, detail="Requirement not found")
-    
-    # Check if link already exists
-    existing = db.query(EvidenceLink).filter(
-        EvidenceLink.document_id == document_id,
-        EvidenceLink.control_id == request.control_id,
-        EvidenceLink.requirement_id == request.requirement_id
-    ).first()
-    
-    if existing:
+    if not requirement_exists:
+        raise HTTPException(status_code=404, detail="Requirement not found")
+    if link_exists:
         raise HTTPException(status_code=400, detail="Evidence link already exists")
     
     # Create evidence link
     evidence_link = EvidenceLink(
-        org_id=document.org_id,
+        org_id=org_id,
         control_id=request.control_id,
         requirement_id=request.requirement_id,
         document_id=document_id,
@@ -2101,7 +2230,7 @@ async def link_evidence_to_control(
     db.commit()
     
     # Trigger text extraction in background if not already done
-    background_tasks.add_task(extract_document_text.delay, str(document.id))
+    background_tasks.add_task(extract_document_text.delay, str(document_id))
     
     return {
         "message": "Evidence linked successfully",
@@ -2120,10 +2249,25 @@ async def get_control_evidence(control_id: str, db: Session = Depends(get_db)):
     result = []
 
     # Get AI-linked evidence (DocumentControlLink)
-    ai_links = db.query(DocumentControlLink).filter(
+    ai_links = db.query(DocumentControlLink).options(
+        selectinload(DocumentControlLink.document)
+    ).filter(
         DocumentControlLink.control_id == control.id
     ).all()
 
+    # Get manually linked evidence (EvidenceLink)
+    manual_links = db.query(EvidenceLink).options(
+        selectinload(EvidenceLink.document),
+        selectinload(EvidenceLink.requirement)
+    ).filter(
+        EvidenceLink.control_id == control.id
+    ).all()
+
+    # Sign each distinct document's download URL once for both kinds of link
+    download_urls = storage.get_download_urls(
+        link.document.storage_key for link in (*ai_links, *manual_links)
+    )
+
     for link in ai_links:
         result.append({
             "id": str(link.id),
@@ -2133,7 +2277,7 @@ async def get_control_evidence(control_id: str, db: Session = Depends(get_db)):
                 "mime_type": link.document.mime_type,
                 "file_size": link.document.file_size,
                 "created_at": link.document.created_at.isoformat(),
-                "download_url": storage.get_download_url(link.document.storage_key)
+                "download_url": download_urls[link.document.storage_key]
             },
             "requirement": None,  # AI links are control-level, not requirement-level
             "note": "",
@@ -2143,11 +2287,6 @@ async def get_control_evidence(control_id: str, db: Session = Depends(get_db)):
             "is_ai_linked": True
         })
 
-    # Get manually linked evidence (EvidenceLink)
-    manual_links = db.query(EvidenceLink).filter(
-        EvidenceLink.control_id == control.id
-    ).all()
-
     for link in manual_links:
         result.append({
             "id": str(link.id),
@@ -2157,7 +2296,7 @@ async def get_control_evidence(control_id: str, db: Session = Depends(get_db)):
                 "mime_type": link.document.mime_type,
                 "file_size": link.document.file_size,
                 "created_at": link.document.created_at.isoformat(),
-                "download_url": storage.get_download_url(link.document.storage_key)
+                "download_url": download_urls[link.document.storage_key]
             },
             "requirement": {
                 "id": str(link.requirement.id),
@@ -2256,18 +2395,16 @@ async def create_scan(
         raise HTTPException(status_code=400, detail="No organization found")
 
     # Check if there's evidence linked to this control (manual OR AI-linked)
-    manual_evidence_count = db.query(EvidenceLink).filter(
-        EvidenceLink.control_id == control.id,
-        EvidenceLink.org_id == org.id
-    ).count()
-
-    ai_evidence_count = db.query(DocumentControlLink).filter(
-        DocumentControlLink.control_id == control.id
-    ).count()
-
-    total_evidence = manual_evidence_count + ai_evidence_count
-
-    if total_evidence == 0:
+    # EXISTS stops at the first matching row instead of counting them all
+    has_evidence = db.query(or_(
+        exists().where(
+            EvidenceLink.control_id == control.id,
+            EvidenceLink.org_id == org.id
+        ),
+        exists().where(DocumentControlLink.control_id == control.id)
+    )).scalar()
+
+    if not has_evidence:
         raise HTTPException(
             status_code=400,
             detail="No evidence linked to this control. Please upload and link evidence documents first."
@@ -2293,19 +2430,81 @@ async def create_scan(
         "message": "Scan started. Check status using the scan_id."
     }
 
+# Scan results are fetched from the database and encoded this many rows at a time
+SCAN_STATUS_BATCH_SIZE = 100
+
+def _stream_scan_status(scan_id, header: dict) -> Iterator[bytes]:
+    """
+    Encode a scan status document piece by piece: the scan fields, then each result and gap as it
+    is read. Uses its own session because it runs after the request's dependencies have exited.
+    The stream is not atomic: the 200 status is already sent when rows are read, so a database
+    error closes the document with an "error" field instead of truncating it.
+    """
+    head = orjson.dumps(header)
+    yield head[:-1] + b',"results":['
+    
+    # Bytes that close the arrays still open at the current point of the document
+    closing = b'],"gaps":[]'
+    db = SessionLocal()
+    try:
+        results = (
+            db.query(ScanResult)
+            .options(selectinload(ScanResult.requirement))
+            .filter(ScanResult.scan_id == scan_id)
+            .yield_per(SCAN_STATUS_BATCH_SIZE)
+        )
+        separator = b""
+        for result in results:
+            yield separator + orjson.dumps({
+                "requirement": {
+                    "id": str(result.requirement.id),
+                    "req_code": result.requirement.req_code,
+                    "text": result.requirement.text,
+                    "maturity_level": result.requirement.maturity_level
+                },
+                "outcome": result.outcome,
+                "confidence": result.confidence,
+                "rationale": _safe_json_loads(result.rationale_json),
+                "citations": _safe_json_loads(result.citations_json, default=[])
+            })
+            separator = b","
+        
+        yield b'],"gaps":['
+        closing = b']'
+        gaps = (
+            db.query(Gap)
+            .options(selectinload(Gap.requirement))
+            .filter(Gap.scan_id == scan_id)
+            .yield_per(SCAN_STATUS_BATCH_SIZE)
+        )
+        separator = b""
+        for gap in gaps:
+            yield separator + orjson.dumps({
+                "requirement": {
+                    "id": str(gap.requirement.id),
+                    "req_code": gap.requirement.req_code,
+                    "text": gap.requirement.text
+                },
+                "summary": gap.gap_summary,
+                "recommended_actions": _safe_json_loads(gap.recommended_actions_json, default=[])
+            })
+            separator = b","
+        yield b"]}"
+    except Exception:
+        logger.exception(f"Failed to stream results of scan {scan_id}")
+        yield closing + b',"error":"Failed to load scan results"}'
+    finally:
+        db.close()
+
 @app.get("/scans/{scan_id}")
 async def get_scan_status(scan_id: str, db: Session = Depends(get_db)):
     """Get the status and results of a scan."""
     
-    scan = db.query(Scan).filter(Scan.id == scan_id).first()
+    scan = db.query(Scan).options(joinedload(Scan.control)).filter(Scan.id == scan_id).first()
     if not scan:
         raise HTTPException(status_code=404, detail="Scan not found")
     
-    # Get scan results
-    results = db.query(ScanResult).filter(ScanResult.scan_id == scan.id).all()
-    gaps = db.query(Gap).filter(Gap.scan_id == scan.id).all()
-    
-    return {
+    header = {
         "id": str(scan.id),
         "control": {
             "id": str(scan.control.id),
@@ -2320,37 +2519,14 @@ async def get_scan_status(scan_id: str, db: Session = Depends(get_db)):
         "total_requirements": scan.total_requirements or 0,
         "processed_requirements": scan.processed_requirements or 0,
         "created_at": scan.created_at.isoformat(),
-        "updated_at": scan.updated_at.isoformat(),
-        "results": [
-            {
-                "requirement": {
-                    "id": str(result.requirement.id),
-                    "req_code": result.requirement.req_code,
-                    "text": result.requirement.text,
-                    "maturity_level": result.requirement.maturity_level
-                },
-                "outcome": result.outcome,
-                "confidence": result.confidence,
-                "rationale": _safe_json_loads(result.rationale_json),
-                "citations": _safe_json_loads(result.citations_json, default=[])
-            }
-            for result in results
-        ],
-        "gaps": [
-            {
-                "requirement": {
-                    "id": str(gap.requirement.id),
-                    "req_code": gap.requirement.req_code,
-                    "text": gap.requirement.text
-                },
-                "summary": gap.gap_summary,
-                "recommended_actions": _safe_json_loads(gap.recommended_actions_json, default=[])
-            }
-            for gap in gaps
-        ]
+        "updated_at": scan.updated_at.isoformat()
     }
+    
+    # Results and gaps are streamed (on the threadpool, since the generator is sync) rather
+    # than built into one list, so large scans don't hold every row in memory at once
+    return StreamingResponse(_stream_scan_status(scan.id, header), media_type="application/json")
 
-@app.get("/controls/{control_id}/scans")
+@app.get("/controls/{control_id}/scans", response_class=ORJSONResponse)
 async def get_control_scans(control_id: str, db: Session = Depends(get_db)):
     """Get all scans for a control."""
 
@@ -2363,10 +2539,11 @@ async def get_control_scans(control_id: str, db: Session = Depends(get_db)):
         Scan.control_id == control.id
     ).order_by(Scan.created_at.desc()).all()
     
-    return {
+    # orjson serializes UUID and datetime natively, so skip str()/isoformat() per row
+    return ORJSONResponse({
         "scans": [
             {
-                "id": str(scan.id),
+                "id": scan.id,
                 "status": scan.status,
                 "model": scan.model,
                 "prompt_version": scan.prompt_version,
@@ -2374,11 +2551,11 @@ async def get_control_scans(control_id: str, db: Session = Depends(get_db)):
                 "current_step": scan.current_step or 'Initializing...',
                 "total_requirements": scan.total_requirements or 0,
                 "processed_requirements": scan.processed_requirements or 0,
-                "created_at": scan.created_at.isoformat()
+                "created_at": scan.created_at
             }
             for scan in scans
         ]
-    }
+    })
 
 # AI Settings endpoints
 class AISettingsRequest(BaseModel):
@@ -2478,6 +2655,7 @@ async def save_ai_settings(settings_request: AISettingsRequest, db: Session = De
 
     db.commit()
     db.refresh(settings)
+    invalidate_ai_client()
 
     return {"message": "Settings saved successfully"}
 
@@ -2486,8 +2664,6 @@ async def test_ai_connection(settings: AISettingsRequest):
     """Test connection to the specified AI provider."""
     try:
         if settings.provider == "openai":
-            from openai import OpenAI
-            
             if not settings.openai_api_key or settings.openai_api_key == "***":
                 api_key = os.getenv("OPENAI_API_KEY")
             else:
@@ -2504,12 +2680,9 @@ async def test_ai_connection(settings: AISettingsRequest):
             if not api_key and base_url:
                 api_key = LOCAL_AI_PLACEHOLDER_KEY
 
-            client = OpenAI(
-                api_key=api_key,
-                base_url=base_url
-            )
-            response = create_chat_completion_safe(
-                client=client,
+            # Pooled per key/endpoint, so repeated tests reuse the open connection
+            client = get_async_openai_client(api_key, base_url)
+            response = await client.chat.completions.create(
                 model=settings.openai_model or "gpt-4o-mini",
                 messages=[{"role": "user", "content": "Reply with exactly: 'OpenAI connection successful'"}],
                 max_tokens=10
@@ -2522,24 +2695,23 @@ async def test_ai_connection(settings: AISettingsRequest):
             }
             
         elif settings.provider == "ollama":
-            import requests
-            
             endpoint = settings.ollama_endpoint or "http://localhost:11434"
             model = settings.ollama_model or "llama2"
             
-            # Test Ollama connection
-            response = requests.post(
+            # Test Ollama connection over the shared keep-alive client
+            response = await ollama_http.post(
                 f"{endpoint}/api/generate",
-                json={
+                content=orjson.dumps({
                     "model": model,
                     "prompt": "Reply with exactly: 'Ollama connection successful'",
                     "stream": False
-                },
+                }),
+                headers=JSON_HEADERS,
                 timeout=30
             )
             
             if response.status_code == 200:
-                result = response.json()
+                result = orjson.loads(response.content)
                 return {
                     "status": "success",
                     "test_response": result.get("response", "Connection successful"),
@@ -2556,14 +2728,19 @@ async def test_ai_connection(settings: AISettingsRequest):
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Connection test failed: {str(e)}")
 
+# The settings page re-requests the model list on every visit; tags change rarely
+_ollama_models_cache = _TTLCache(capacity=32, ttl=30.0)
+
 @app.get("/settings/ollama/models")
 async def get_ollama_models(endpoint: str = "http://localhost:11434"):
     """Get list of available models from Ollama instance."""
+    cached = _ollama_models_cache.get(endpoint)
+    if cached is not None:
+        return cached
+    
     try:
-        import requests
-        
-        # Get list of models from Ollama
-        response = requests.get(f"{endpoint}/api/tags", timeout=10)
+        # Get list of models from Ollama over the shared keep-alive client
+        response = await ollama_http.get(f"{endpoint}/api/tags", timeout=10)
         
         if response.status_code != 200:
             raise HTTPException(
@@ -2571,7 +2748,7 @@ async def get_ollama_models(endpoint: str = "http://localhost:11434"):
                 detail=f"Cannot connect to Ollama at {endpoint}. Make sure Ollama is running."
             )
         
-        data = response.json()
+        data = orjson.loads(response.content)
         models = []
         
         for model in data.get('models', []):
@@ -2592,13 +2769,17 @@ async def get_ollama_models(endpoint: str = "http://localhost:11434"):
         # Sort by family and name
         models.sort(key=lambda x: (x['family'], x['name']))
         
-        return {
+        result = {
             "models": models,
             "endpoint": endpoint,
             "total_models": len(models)
         }
+        _ollama_models_cache.set(endpoint, result)
+        return result
         
-    except requests.exceptions.RequestException as e:
+    except HTTPException:
+        raise
+    except httpx.HTTPError as e:
         raise HTTPException(
             status_code=400, 
             detail=f"Failed to connect to Ollama: {str(e)}"
@@ -2645,12 +2826,102 @@ async def get_demo_ollama_models():
         "demo": True
     }
 
+def _models_response(models: List[dict], endpoint: str) -> dict:
+    """Sort a model listing by name and wrap it in the API response shape."""
+    models.sort(key=itemgetter('name'))
+    return {
+        "models": models,
+        "endpoint": endpoint,
+        "total_models": len(models)
+    }
+
+# In-flight /settings/openai/models lookups keyed by (endpoint, api key hash), so that
+# identical concurrent requests share one upstream call instead of each making their own.
+_openai_models_inflight: Dict[tuple, asyncio.Future] = {}
+
 @app.get("/settings/openai/models")
 async def get_openai_models(endpoint: Optional[str] = None, api_key: Optional[str] = None):
     """Get list of available models from OpenAI or custom OpenAI-compatible endpoint."""
+    key = (
+        endpoint or os.getenv("OPENAI_ENDPOINT") or "openai",
+        hashlib.sha256((api_key or "").encode()).hexdigest()
+    )
+    future = _openai_models_inflight.get(key)
+    if future is None:
+        future = asyncio.ensure_future(asyncio.to_thread(_fetch_openai_models, endpoint, api_key))
+        _openai_models_inflight[key] = future
+
+        def _forget(done: asyncio.Future) -> None:
+            if _openai_models_inflight.get(key) is done:
+                del _openai_models_inflight[key]
+
+        future.add_done_callback(_forget)
+    
+    # Shield so one client disconnecting does not cancel the lookup for the others
+    return await asyncio.shield(future)
+
+# Keep-alive session for the blocking Ollama probes made from threadpool code
+_ollama_session = requests.Session()
+_ollama_session.mount("http://", requests.adapters.HTTPAdapter(pool_connections=10, pool_maxsize=20))
+_ollama_session.mount("https://", requests.adapters.HTTPAdapter(pool_connections=10, pool_maxsize=20))
+
+def _ollama_root(base_url: str) -> str:
+    """Strip the OpenAI-compatible /v1 suffix from an Ollama base URL."""
+    root = base_url.rstrip('/')
+    return root[:-3] if root.endswith('/v1') else root
+
+# base URL -> (expires_at, is_ollama). A positive probe is kept for good; a failed or negative
+# one is retried after OLLAMA_PROBE_NEGATIVE_TTL so an Ollama that was still starting gets
+# picked up. Read and written from threadpool code, where single dict operations are atomic.
+OLLAMA_PROBE_NEGATIVE_TTL = 60.0
+_ollama_probe_cache: Dict[str, tuple] = {}
+
+def _looks_like_ollama(base_url: str) -> bool:
+    """Whether an OpenAI-compatible base URL is served by Ollama (probe results cached per URL)."""
+    if ':11434' in base_url:
+        return True
+    if not base_url.rstrip('/').endswith('/v1'):
+        return False
+    cached = _ollama_probe_cache.get(base_url)
+    if cached is not None and cached[0] > time.monotonic():
+        return cached[1]
+    try:
+        response = _ollama_session.get(f"{_ollama_root(base_url)}/api/tags", timeout=3)
+        is_ollama = response.status_code == 200 and 'models' in response.json()
+    except Exception:
+        is_ollama = False
+    if len(_ollama_probe_cache) >= 64:
+        _ollama_probe_cache.clear()
+    _ollama_probe_cache[base_url] = (
+        float('inf') if is_ollama else time.monotonic() + OLLAMA_PROBE_NEGATIVE_TTL, is_ollama
+    )
+    return is_ollama
+
+def _fetch_ollama_tags(base_url: str) -> List[dict]:
+    """List models via Ollama's native /api/tags in the OpenAI models shape (empty on failure)."""
+    try:
+        response = _ollama_session.get(f"{_ollama_root(base_url)}/api/tags", timeout=10)
+        if response.status_code != 200:
+            return []
+        return [
+            {
+                'id': model['name'],
+                'name': model['name'],
+                'display_name': model['name'],
+                'created': 0,
+                'owned_by': 'library',
+                'object': 'model'
+            }
+            for model in response.json().get('models', [])
+            if isinstance(model, dict) and model.get('name')
+        ]
+    except Exception as e:
+        logger.warning(f"Ollama /api/tags lookup failed for {base_url}: {e}")
+        return []
+
+def _fetch_openai_models(endpoint: Optional[str], api_key: Optional[str]) -> dict:
+    """Query the models endpoint of OpenAI or a custom OpenAI-compatible endpoint."""
     try:
-        from openai import OpenAI
-        
         # Use provided endpoint or fall back to environment/default
         base_url = endpoint if endpoint else os.getenv("OPENAI_ENDPOINT")
         
@@ -2666,6 +2937,13 @@ async def get_openai_models(endpoint: Optional[str] = None, api_key: Optional[st
         if not api_key and base_url:
             api_key = LOCAL_AI_PLACEHOLDER_KEY
 
+        # Ollama's native tag listing is one cheap call; models.list() there often
+        # fails and costs a second round-trip through the fallback below
+        if base_url and _looks_like_ollama(base_url):
+            models = _fetch_ollama_tags(base_url)
+            if models:
+                return _models_response(models, base_url)
+
         # Create client with custom endpoint if provided
         client = OpenAI(
             api_key=api_key,
@@ -2676,7 +2954,6 @@ async def get_openai_models(endpoint: Optional[str] = None, api_key: Optional[st
         try:
             logger.info(f"Querying models from endpoint: {base_url or 'https://api.openai.com/v1'}")
             models_response = client.models.list()
-            logger.info(f"Models response type: {type(models_response)}")
             
             # Handle case where models_response or data is None
             if not models_response:
@@ -2689,23 +2966,20 @@ async def get_openai_models(endpoint: Optional[str] = None, api_key: Optional[st
             if models_response.data is None:
                 raise HTTPException(status_code=500, detail="Models endpoint returned null data")
             
-            logger.info(f"Models data type: {type(models_response.data)}, length: {len(models_response.data) if models_response.data else 'N/A'}")
-            
-            models = []
-            if models_response.data:
-                for i, model in enumerate(models_response.data):
-                    logger.info(f"Processing model {i}: {type(model)}")
-                    if model and hasattr(model, 'id'):
-                        models.append({
-                            'id': model.id,
-                            'name': model.id,  # For compatibility with frontend
-                            'display_name': model.id,
-                            'created': getattr(model, 'created', 0),
-                            'owned_by': getattr(model, 'owned_by', 'unknown'),
-                            'object': getattr(model, 'object', 'model')
-                        })
-                    else:
-                        logger.warning(f"Skipping invalid model at index {i}: {model}")
+            data = models_response.data
+            models = [
+                {
+                    'id': model.id,
+                    'name': model.id,  # For compatibility with frontend
+                    'display_name': model.id,
+                    'created': getattr(model, 'created', 0),
+                    'owned_by': getattr(model, 'owned_by', 'unknown'),
+                    'object': getattr(model, 'object', 'model')
+                }
+                for model in data
+                if model is not None and getattr(model, 'id', None)
+            ]
+            logger.debug(f"Fetched {len(models)} models")
                     
         except AttributeError as e:
             raise HTTPException(status_code=500, detail=f"Unexpected response format from models endpoint: {str(e)}")
@@ -2724,29 +2998,24 @@ async def get_openai_models(endpoint: Optional[str] = None, api_key: Optional[st
                     
                     if response.status_code == 200:
                         data = response.json()
-                        logger.info(f"Direct HTTP response: {data}")
                         
-                        models = []
                         model_list = data.get('data', []) if isinstance(data, dict) else []
-                        
-                        for model in model_list:
-                            if isinstance(model, dict) and 'id' in model:
-                                models.append({
-                                    'id': model['id'],
-                                    'name': model['id'],
-                                    'display_name': model['id'],
-                                    'created': model.get('created', 0),
-                                    'owned_by': model.get('owned_by', 'unknown'),
-                                    'object': model.get('object', 'model')
-                                })
+                        models = [
+                            {
+                                'id': model['id'],
+                                'name': model['id'],
+                                'display_name': model['id'],
+                                'created': model.get('created', 0),
+                                'owned_by': model.get('owned_by', 'unknown'),
+                                'object': model.get('object', 'model')
+                            }
+                            for model in model_list
+                            if isinstance(model, dict) and 'id' in model
+                        ]
+                        logger.debug(f"Fetched {len(models)} models via direct HTTP")
                         
                         if models:
-                            models.sort(key=lambda x: x['name'])
-                            return {
-                                "models": models,
-                                "endpoint": base_url,
-                                "total_models": len(models)
-                            }
+                            return _models_response(models, base_url)
                     
                     logger.error(f"Direct HTTP request failed: {response.status_code} - {response.text}")
                     
@@ -2758,14 +3027,7 @@ async def get_openai_models(endpoint: Optional[str] = None, api_key: Optional[st
             else:
                 raise HTTPException(status_code=500, detail=f"Error querying models: {str(e)}")
         
-        # Sort by name
-        models.sort(key=lambda x: x['name'])
-        
-        return {
-            "models": models,
-            "endpoint": base_url or "https://api.openai.com/v1",
-            "total_models": len(models)
-        }
+        return _models_response(models, base_url or "https://api.openai.com/v1")
         
     except Exception as e:
         error_msg = str(e).lower()
@@ -2808,104 +3070,74 @@ def create_chat_completion_safe(client, model, messages, max_tokens=None, temper
     # Make request without JSON mode
     return client.chat.completions.create(**params)
 
+# Alternatives are tried in priority order from the start of the name, so a name
+# matching several families resolves the same way as a sequence of substring checks
+_MODEL_FAMILY_RE = re.compile(
+    r"^(?:.*(codellama)|.*(llama)|.*(mistral)|.*(mixtral)|.*(phi)|.*(gemma)|.*(qwen))",
+    re.IGNORECASE | re.DOTALL
+)
+_MODEL_FAMILY_NAMES = {
+    'codellama': 'Code Llama',
+    'llama': 'Llama',
+    'mistral': 'Mistral',
+    'mixtral': 'Mixtral',
+    'phi': 'Phi',
+    'gemma': 'Gemma',
+    'qwen': 'Qwen',
+}
+
+@functools.lru_cache(maxsize=4096)
 def get_model_family(model_name: str) -> str:
     """Categorize model by family for better organization."""
-    name_lower = model_name.lower()
-    
-    if 'llama' in name_lower:
-        return 'Llama'
-    elif 'mistral' in name_lower:
-        return 'Mistral'
-    elif 'mixtral' in name_lower:
-        return 'Mixtral'
-    elif 'codellama' in name_lower:
-        return 'Code Llama'
-    elif 'phi' in name_lower:
-        return 'Phi'
-    elif 'gemma' in name_lower:
-        return 'Gemma'
-    elif 'qwen' in name_lower:
-        return 'Qwen'
-    else:
+    match = _MODEL_FAMILY_RE.match(model_name)
+    if not match:
         return 'Other'
+    return _MODEL_FAMILY_NAMES[match.group(match.lastindex).lower()]
 
 # AI-powered document analysis endpoints
 class ControlAnalysisRequest(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
     prompt: str
     max_tokens: Optional[int] = 1000
     temperature: Optional[float] = 0.3
 
+class DocSpec(BaseModel):
+    filename: str
+    type: str
+    content: Optional[str] = None
+
 class DocumentBatchAnalysisRequest(BaseModel):
-    documents: List[dict]  # [{filename, content, type}]
+    model_config = ConfigDict(extra="forbid")
+
+    documents: List[DocSpec]
     controls: List[dict]   # [{code, title, framework, description, evidence_types}]
     prompt: str
 
+# Upper bound on prompts per batch request, and on how many of them are sent to the
+# AI provider at once (shared by all batch requests in this worker process)
+TEXT_BATCH_MAX_PROMPTS = 32
+TEXT_BATCH_CONCURRENCY = int(os.getenv("TEXT_BATCH_CONCURRENCY", "4"))
+_text_batch_semaphore = asyncio.Semaphore(TEXT_BATCH_CONCURRENCY)
+
+class TextBatchAnalysisRequest(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    prompts: List[str] = Field(min_length=1, max_length=TEXT_BATCH_MAX_PROMPTS)
+    max_tokens: Optional[int] = 1000
+    temperature: Optional[float] = 0.3
+
+TEXT_ANALYSIS_SYSTEM_PROMPT = "You are a helpful AI assistant that analyzes documents and provides structured responses."
+
 @app.post("/ai/analyze-text")
 async def analyze_text_with_ai(request: ControlAnalysisRequest):
     """Analyze text using the configured AI provider."""
     try:
-        from ai_scanner import get_ai_client
-        import json as json_module
-        
-        ai_client = get_ai_client()
         
-        if isinstance(ai_client, dict) and ai_client.get('type') == 'ollama':
-            # Handle Ollama
-            import requests
-            
-            endpoint = ai_client['endpoint']
-            model = ai_client['model']
-            
-            response = requests.post(
-                f"{endpoint}/api/generate",
-                json={
-                    "model": model,
-                    "prompt": request.prompt,
-                    "stream": False,
-                    "options": {
-                        "temperature": request.temperature,
-                        "num_predict": request.max_tokens,
-                        "num_ctx": int(os.getenv("OLLAMA_CONTEXT_SIZE", "32768"))
-                    }
-                },
-                timeout=60
-            )
-            
-            if response.status_code != 200:
-                raise HTTPException(
-                    status_code=500, 
-                    detail=f"Ollama API error: {response.status_code} - {response.text}"
-                )
-            
-            result = response.json()
-            ai_response = result.get('response', '')
-            
-            # Check thinking field if response is empty (some models use this field)
-            if not ai_response and 'thinking' in result:
-                ai_response = result.get('thinking', '')
-            
-        else:
-            # Handle OpenAI
-            model = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
-            
-            response = create_chat_completion_safe(
-                client=ai_client,
-                model=model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are a helpful AI assistant that analyzes documents and provides structured responses."
-                    },
-                    {
-                        "role": "user", 
-                        "content": request.prompt
-                    }
-                ],
-                max_tokens=request.max_tokens,
-                temperature=request.temperature
-            )
-            
-            ai_response = response.choices[0].message.content
+        provider = get_ai_provider()
+        ai_response = await provider.complete(
+            request.prompt, request.max_tokens, request.temperature, system=TEXT_ANALYSIS_SYSTEM_PROMPT
+        )
         
         return {"response": ai_response}
 
@@ -2916,6 +3148,64 @@ async def analyze_text_with_ai(request: ControlAnalysisRequest):
             detail=f"AI analysis failed: {str(e)}"
         )
 
+@app.post("/ai/analyze-text-batch")
+async def analyze_text_batch_with_ai(request: TextBatchAnalysisRequest):
+    """
+    Analyze several independent prompts in one call.
+    Prompts are sent to the AI provider concurrently (at most TEXT_BATCH_CONCURRENCY at a time)
+    and each gets its own {"response": ...} or {"error": ...} entry, in request order.
+    """
+    try:
+        
+        provider = get_ai_provider()
+
+        async def complete_one(prompt: str) -> str:
+            async with _text_batch_semaphore:
+                return await provider.complete(
+                    prompt, request.max_tokens, request.temperature, system=TEXT_ANALYSIS_SYSTEM_PROMPT
+                )
+
+        outcomes = await asyncio.gather(
+            *[complete_one(prompt) for prompt in request.prompts], return_exceptions=True
+        )
+        
+        responses = []
+        for outcome in outcomes:
+            if isinstance(outcome, BaseException):
+                logger.error(f"Batch AI analysis prompt failed: {outcome}")
+                responses.append({"error": f"AI analysis failed: {str(outcome)}"})
+            else:
+                responses.append({"response": outcome})
+        return {"responses": responses}
+
+    except Exception as e:
+        logger.error(f"Batch AI analysis failed: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Batch AI analysis failed: {str(e)}"
+        )
+
+def _preprocess_image(content: bytes) -> bytes:
+    """Normalize an uploaded image to an RGB JPEG no larger than 1024x1024 (executed in _IMG_POOL)."""
+
+    try:
+        pil_image = Image.open(io.BytesIO(content))
+        # Convert to RGB if needed
+        if pil_image.mode != 'RGB':
+            pil_image = pil_image.convert('RGB')
+
+        # Resize if too large
+        max_size = (1024, 1024)
+        if pil_image.size[0] > max_size[0] or pil_image.size[1] > max_size[1]:
+            pil_image.thumbnail(max_size, Image.Resampling.LANCZOS)
+
+        # Convert to bytes
+        img_buffer = io.BytesIO()
+        pil_image.save(img_buffer, format='JPEG', quality=85)
+        return img_buffer.getvalue()
+    except Exception:
+        return content
+
 @app.post("/api/ai/analyze-image")
 async def analyze_image_with_ai(
     image: UploadFile = File(...),
@@ -2923,41 +3213,20 @@ async def analyze_image_with_ai(
 ):
     """Analyze an image using vision AI and suggest compliance controls."""
     try:
-        from ai_scanner import get_ai_client
-        import base64
-        from PIL import Image
-        import io
-        import json as json_module
 
         # Read image content
-        image_content = await image.read()
+        image_content = await _read_capped(image)
 
-        # Process image with PIL
-        try:
-            pil_image = Image.open(io.BytesIO(image_content))
-            # Convert to RGB if needed
-            if pil_image.mode != 'RGB':
-                pil_image = pil_image.convert('RGB')
-
-            # Resize if too large
-            max_size = (1024, 1024)
-            if pil_image.size[0] > max_size[0] or pil_image.size[1] > max_size[1]:
-                pil_image.thumbnail(max_size, Image.Resampling.LANCZOS)
-
-            # Convert to bytes
-            img_buffer = io.BytesIO()
-            pil_image.save(img_buffer, format='JPEG', quality=85)
-            processed_content = img_buffer.getvalue()
-        except Exception:
-            processed_content = image_content
-
-        ai_client = get_ai_client()
+        provider = get_ai_provider()
 
-        if not isinstance(ai_client, dict):  # OpenAI
+        if isinstance(provider, OpenAIProvider):  # Vision needs the raw OpenAI client
             try:
+                # Resize/re-encode off the event loop; only the vision request uses the processed copy
+                processed_content = await asyncio.get_running_loop().run_in_executor(_IMG_POOL, _preprocess_image, image_content)
                 image_b64 = base64.b64encode(processed_content).decode('utf-8')
 
-                response = ai_client.chat.completions.create(
+                response = await asyncio.to_thread(
+                    provider.client.chat.completions.create,
                     model="gpt-4o",
                     messages=[
                         {
@@ -2988,22 +3257,14 @@ async def analyze_image_with_ai(
             except Exception as e:
                 logger.warning(f"Vision AI failed for {image.filename}: {e}")
                 # Fallback to OCR
-                import pytesseract
-                ocr_text = pytesseract.image_to_string(Image.open(io.BytesIO(image_content)))
+                ocr_text = await asyncio.get_running_loop().run_in_executor(_OCR_POOL, ocr_image_bytes, image_content)
 
                 if ocr_text.strip():
                     # Analyze OCR text with the prompt
-                    response = ai_client.chat.completions.create(
-                        model="gpt-4o-mini",
-                        messages=[
-                            {
-                                "role": "user",
-                                "content": f"{prompt}\n\nExtracted text from image:\n{ocr_text[:3000]}"
-                            }
-                        ],
+                    ai_response = await provider.complete(
+                        f"{prompt}\n\nExtracted text from image:\n{ocr_text[:3000]}",
                         max_tokens=2000
                     )
-                    ai_response = response.choices[0].message.content
                     return {"response": ai_response}
                 else:
                     raise HTTPException(
@@ -3012,8 +3273,7 @@ async def analyze_image_with_ai(
                     )
         else:  # Ollama
             # Use OCR for Ollama
-            import pytesseract
-            ocr_text = pytesseract.image_to_string(Image.open(io.BytesIO(image_content)))
+            ocr_text = await asyncio.get_running_loop().run_in_executor(_OCR_POOL, ocr_image_bytes, image_content)
 
             if not ocr_text.strip():
                 raise HTTPException(
@@ -3022,38 +3282,8 @@ async def analyze_image_with_ai(
                 )
 
             # Analyze OCR text with Ollama
-            import requests
-            endpoint = ai_client['endpoint']
-            model = ai_client['model']
-
             analysis_prompt = f"{prompt}\n\nExtracted text from image:\n{ocr_text[:3000]}"
-
-            response = requests.post(
-                f"{endpoint}/api/generate",
-                json={
-                    "model": model,
-                    "prompt": analysis_prompt,
-                    "stream": False,
-                    "options": {
-                        "temperature": 0.3,
-                        "num_predict": 2000,
-                        "num_ctx": int(os.getenv("OLLAMA_CONTEXT_SIZE", "32768"))
-                    }
-                },
-                timeout=120
-            )
-
-            if response.status_code != 200:
-                raise HTTPException(
-                    status_code=500,
-                    detail=f"Ollama API error: {response.status_code}"
-                )
-
-            result = response.json()
-            ai_response = result.get('response', '')
-
-            if not ai_response and 'thinking' in result:
-                ai_response = result.get('thinking', '')
+            ai_response = await provider.complete(analysis_prompt, max_tokens=2000, temperature=0.3, timeout=120)
 
             logger.info(f"OCR + Ollama analysis complete for {image.filename}")
             return {"response": ai_response}
@@ -3071,17 +3301,17 @@ async def analyze_image_with_ai(
 async def analyze_multiple_documents(request: DocumentBatchAnalysisRequest):
     """Analyze multiple documents together and suggest relevant compliance controls."""
     try:
-        from ai_scanner import get_ai_client
-        import json as json_module
         
-        ai_client = get_ai_client()
+        provider = get_ai_provider()
         
         # Prepare the analysis prompt with all document information
         documents_summary = []
         for doc in request.documents:
-            doc_info = f"Document: {doc['filename']} ({doc['type']})"
-            if doc.get('content') and doc['content'].strip():
-                doc_info += f"\nContent preview: {doc['content'][:8000]}{'...' if len(doc['content']) > 8000 else ''}"
+            doc_info = f"Document: {doc.filename} ({doc.type})"
+            content = doc.content or ''
+            if content.strip():
+                preview = content if len(content) <= 8000 else content[:8000] + '...'
+                doc_info += f"\nContent preview: {preview}"
             documents_summary.append(doc_info)
         
         controls_summary = []
@@ -3091,14 +3321,17 @@ async def analyze_multiple_documents(request: DocumentBatchAnalysisRequest):
                 ctrl_info += f" - Evidence needed: {ctrl['evidence_types']}"
             controls_summary.append(ctrl_info)
         
+        documents_block = "\n".join(documents_summary)
+        controls_block = "\n".join(controls_summary)
+        
         enhanced_prompt = f"""
 {request.prompt}
 
 Documents to analyze:
-{chr(10).join(documents_summary)}
+{documents_block}
 
 Available compliance controls:
-{chr(10).join(controls_summary)}
+{controls_block}
 
 IMPORTANT: You must respond with ONLY valid JSON in this exact format:
 {{
@@ -3115,62 +3348,22 @@ IMPORTANT: You must respond with ONLY valid JSON in this exact format:
 
 Do not include any text before or after the JSON. Do not use markdown formatting. Return only the JSON object."""
 
-        result = None
+        # All documents share one completion, so give the model room for a suggestion per document
+        max_tokens = min(4000, max(2000, 500 * len(request.documents)))
         
-        if isinstance(ai_client, dict) and ai_client.get('type') == 'ollama':
-            # Handle Ollama
-            import requests
-            
-            endpoint = ai_client['endpoint']
-            model = ai_client['model']
-            
-            response = requests.post(
-                f"{endpoint}/api/generate",
-                json={
-                    "model": model,
-                    "prompt": enhanced_prompt,
-                    "stream": False,
-                    "options": {
-                        "temperature": 0.3,
-                        "num_predict": 2000,
-                        "num_ctx": int(os.getenv("OLLAMA_CONTEXT_SIZE", "32768"))
-                    }
-                },
-                timeout=45  # Reduced timeout to prevent connection drops
-            )
-            
-            if response.status_code == 200:
-                result_json = response.json()
-                result = result_json.get("response", "")
-                
-                # Check thinking field if response is empty (some models use this field)
-                if not result and 'thinking' in result_json:
-                    result = result_json.get('thinking', '')
-            else:
-                raise HTTPException(status_code=500, detail=f"Ollama API error: {response.text}")
-                
-        else:
-            # Handle OpenAI
-            from openai import OpenAI
-            client = OpenAI(api_key=ai_client.api_key, base_url=ai_client.base_url)
-            
-            completion = client.chat.completions.create(
-                model=ai_client.model,
-                messages=[
-                    {"role": "system", "content": "You are a compliance expert. Analyze documents and suggest relevant compliance controls in JSON format."},
-                    {"role": "user", "content": enhanced_prompt}
-                ],
-                max_tokens=2000,
-                temperature=0.3,
-                response_format={"type": "json_object"}
-            )
-            
-            result = completion.choices[0].message.content
+        result = await provider.complete(
+            enhanced_prompt,
+            max_tokens=max_tokens,
+            temperature=0.3,
+            system="You are a compliance expert. Analyze documents and suggest relevant compliance controls in JSON format.",
+            json_mode=True,
+            timeout=45  # Reduced timeout to prevent connection drops
+        )
         
         # Try to parse the response as JSON
         try:
             if result:
-                parsed_result = _extract_json_from_response(result)
+                parsed_result = extract_json_from_response(result)
                 if parsed_result:
                     return {"suggestions": parsed_result.get("suggestions", [])}
                 else:
@@ -3190,6 +3383,266 @@ Do not include any text before or after the JSON. Do not use markdown formatting
             detail=f"Batch analysis failed: {str(e)}"
         )
 
+def _extract_pdf_text(content: bytes, max_pages: int = 3, per_page_chars: int = 1000) -> str:
+    """Extract a bounded text preview from the first pages of a PDF (executed in _PDF_POOL)."""
+
+    pdf_doc = fitz.open(stream=content, filetype="pdf")
+    try:
+        text_pages = []
+        for page_num in range(min(max_pages, pdf_doc.page_count)):
+            page_text = pdf_doc[page_num].get_text()
+            if page_text.strip():
+                text_pages.append(f"Page {page_num + 1}: {page_text[:per_page_chars]}")
+    finally:
+        pdf_doc.close()
+    return "\n\n".join(text_pages)
+
+# Number of BM25-ranked controls sent to the LLM per document
+CONTROL_SHORTLIST_SIZE = int(os.getenv("CONTROL_SHORTLIST_SIZE", "8"))
+CONTROLS_TABLE_HEADER = "code|title|framework|description"
+
+@functools.lru_cache(maxsize=256)
+def _controls_payload(available_controls: str) -> tuple:
+    """Parse an available_controls JSON payload into (controls, table lines, BM25 index, fingerprint)."""
+    try:
+        controls = orjson.loads(available_controls)
+    except orjson.JSONDecodeError:
+        return [], (), None, ""
+    if not controls:
+        return [], (), None, ""
+
+    # Compact pipe-delimited table: about half the tokens of the prose list
+    control_lines = tuple(
+        f"{c.get('code', 'N/A')}|{(c.get('title') or 'N/A')[:80]}|{c.get('framework', 'N/A')}|{(c.get('description') or 'N/A')[:200]}"
+        for c in controls
+    )
+    controls_index = BM25Index([
+        f"{c.get('code', '')} {c.get('title', '')} {c.get('description', '')} {c.get('evidence_types', '')}"
+        for c in controls
+    ])
+    controls_fingerprint = hashlib.blake2b(
+        b"|".join(sorted(str(c.get('code', '')).encode() for c in controls)), digest_size=16
+    ).hexdigest()
+    return controls, control_lines, controls_index, controls_fingerprint
+
+def _controls_table(control_lines) -> str:
+    """Render control table lines under the table header."""
+    return CONTROLS_TABLE_HEADER + "\n" + "\n".join(control_lines)
+
+class ControlSuggestion(BaseModel):
+    model_config = ConfigDict(coerce_numbers_to_str=True)
+
+    control_code: str
+    control_title: str
+    framework_name: str = 'Unknown'
+    confidence: Annotated[float, AfterValidator(lambda v: max(0.0, min(1.0, v)))]  # Clamped to [0, 1]
+    reasoning: str
+
+def _validate_suggestions(suggestions, filename: str) -> Optional[List[dict]]:
+    """Validate and clean raw suggestions, keeping the 3 most confident; None if unusable."""
+    if not isinstance(suggestions, list):
+        if suggestions is not None:
+            logger.warning(f"Invalid suggestions returned for {filename}: {type(suggestions).__name__}")
+        return None
+
+    valid_suggestions = []
+    for suggestion in suggestions:
+        try:
+            valid_suggestions.append(ControlSuggestion.model_validate(suggestion).model_dump())
+        except ValidationError as e:
+            logger.debug(f"Skipping invalid suggestion for {filename}: {e}")
+    # Models don't always respect the limit or order; confidence is already clamped to [0, 1]
+    if len(valid_suggestions) > 3:
+        valid_suggestions = heapq.nlargest(3, valid_suggestions, key=itemgetter('confidence'))
+    return valid_suggestions
+
+def _filename_control_match(controls: list, filename: Optional[str]) -> Optional[List[dict]]:
+    """A certain suggestion when exactly one control is offered and the filename contains its code."""
+    if len(controls) != 1 or not filename:
+        return None
+    control = controls[0]
+    code = str(control.get('code') or '')
+    if not code or not re.search(rf"(?<![A-Za-z0-9]){re.escape(code)}(?![A-Za-z0-9])", filename, re.IGNORECASE):
+        return None
+    return [ControlSuggestion(
+        control_code=code,
+        control_title=control.get('title') or code,
+        framework_name=control.get('framework') or 'Unknown',
+        confidence=1.0,
+        reasoning=f"Filename references control {code}"
+    ).model_dump()]
+
+def _needs_escalation(valid_suggestions: Optional[List[dict]]) -> bool:
+    """
+    Whether a fast-model answer is too weak to keep: unparseable, or suggestions whose best
+    one has low confidence and thin reasoning. A valid empty list ("nothing relevant") is kept.
+    """
+    if valid_suggestions is None:
+        return True
+    if not valid_suggestions:
+        return False
+    top = max(valid_suggestions, key=itemgetter('confidence'))
+    return top['confidence'] < 0.5 and len(top['reasoning']) < 80
+
+CONTROL_ANALYSIS_SYSTEM_PROMPT = "You are a compliance expert that analyzes documents and suggests relevant compliance controls. Respond only with valid JSON."
+
+# One-line scoring rubric; the verbose version cost ~150 prompt tokens per request
+CONFIDENCE_GUIDELINES = (
+    "Confidence (BE STRICT, most should be < 0.5): 0.8-1.0 only explicit, comprehensive policy documents; "
+    "0.6-0.7 strong, specific documentation; 0.4-0.5 partial evidence; 0.2-0.3 weak evidence or filename-only "
+    "matching; 0.0-0.1 no clear relevance. Screenshots or images alone: 0.2-0.4 unless unambiguous."
+)
+
+SUGGESTION_JSON_SCHEMA = (
+    '{"control_code": "CONTROL_CODE", "control_title": "Control Title", '
+    '"framework_name": "Framework Name", "confidence": 0.3, "reasoning": "Brief explanation"}'
+)
+
+JSON_ONLY_INSTRUCTION = "Respond with ONLY the JSON object: no markdown, no text before or after it."
+
+def _log_if_prompt_too_large(prompt: str) -> None:
+    """Warn when a prompt (at ~4 characters per token) uses over half the Ollama context window."""
+    context_size = int(os.getenv("OLLAMA_CONTEXT_SIZE", "32768"))
+    if len(prompt) // 4 > context_size // 2:
+        logger.warning(f"Prompt is ~{len(prompt) // 4} tokens, over half of OLLAMA_CONTEXT_SIZE={context_size}")
+
+# Static segments of the single-document prompt, assembled once at import so each request
+# only joins in the filename, content preview and controls table
+_CONTROL_PROMPT_HEAD = "Which compliance controls does this document relate to?\n\nDocument: "
+_CONTROL_PROMPT_PREVIEW = "\nContent preview: "
+_CONTROL_PROMPT_CONTROLS = "\n\nAvailable compliance controls:\n"
+_CONTROL_PROMPT_TAIL = (
+    f"\n\n{CONFIDENCE_GUIDELINES}\n\n"
+    "Return at most the top 3 matches (empty array if none) in this exact format:\n"
+    f'{{"suggestions": [{SUGGESTION_JSON_SCHEMA}]}}\n'
+    f"{JSON_ONLY_INSTRUCTION}"
+)
+
+def _build_control_analysis_prompt(filename: str, file_text: str, controls_context: str) -> str:
+    """Prompt asking for control suggestions for a single document."""
+    prompt = "".join((
+        _CONTROL_PROMPT_HEAD, filename,
+        _CONTROL_PROMPT_PREVIEW, file_text[:5000], "..." if len(file_text) > 5000 else "",
+        _CONTROL_PROMPT_CONTROLS, controls_context,
+        _CONTROL_PROMPT_TAIL
+    ))
+    _log_if_prompt_too_large(prompt)
+    return prompt
+
+def _build_batch_control_analysis_prompt(documents: List[tuple], controls_context: str) -> str:
+    """Prompt asking for control suggestions for several documents at once, answered per document."""
+    documents_block = "\n\n".join(
+        f"Document {i}: {filename}\nContent preview: {file_text[:5000]}{'...' if len(file_text) > 5000 else ''}"
+        for i, (filename, file_text) in enumerate(documents, 1)
+    )
+    prompt = f"""Available compliance controls:
+{controls_context}
+
+Which of these controls does each of the following {len(documents)} documents relate to?
+
+{documents_block}
+
+{CONFIDENCE_GUIDELINES}
+
+Return "suggestions_by_doc" with exactly one array per document, in document order, each holding at most
+that document's top 3 matches (empty array if none), in this exact format:
+{{"suggestions_by_doc": [[{SUGGESTION_JSON_SCHEMA}], []]}}
+{JSON_ONLY_INSTRUCTION}"""
+    _log_if_prompt_too_large(prompt)
+    return prompt
+
+class _SuggestionBatcher:
+    """
+    Coalesces document analyses that arrive within a short window and share the same
+    controls list and model into a single LLM call.
+    """
+
+    def __init__(self, window: float, max_docs: int):
+        self.window = window
+        self.max_docs = max_docs
+        self._pending: Dict[tuple, list] = {}
+        self._tasks: set = set()
+
+    async def analyze(self, key: tuple, provider, control_lines: tuple, filename: str, file_text: str) -> list:
+        """Queue one document and wait for its unvalidated suggestions (None if the reply was unusable)."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        batch = self._pending.get(key)
+        if batch is None:
+            batch = self._pending[key] = []
+            loop.call_later(self.window, self._flush, key, batch, provider)
+        batch.append((filename, file_text, control_lines, future))
+        if len(batch) >= self._batch_limit(control_lines):
+            self._flush(key, batch, provider)
+        return await future
+
+    def _batch_limit(self, control_lines: tuple) -> int:
+        # Keep the combined prompt inside the model context (roughly 4 characters per token);
+        # each document adds its preview plus its own shortlisted controls
+        per_document = 5500 + sum(len(line) + 1 for line in control_lines)
+        budget = int(os.getenv("OLLAMA_CONTEXT_SIZE", "32768")) * 4 - 8000
+        return max(1, min(self.max_docs, budget // per_document))
+
+    def _flush(self, key: tuple, batch: list, provider) -> None:
+        if self._pending.get(key) is not batch:
+            return  # Already sent because it filled up before the window closed
+        del self._pending[key]
+        task = asyncio.ensure_future(self._run(batch, provider))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: list, provider) -> None:
+        try:
+            if len(batch) == 1:
+                filename, file_text, control_lines, _ = batch[0]
+                ai_response = await provider.complete(
+                    _build_control_analysis_prompt(filename, file_text, _controls_table(control_lines)),
+                    max_tokens=400,  # Three short suggestions fit comfortably
+                    temperature=0.3,
+                    system=CONTROL_ANALYSIS_SYSTEM_PROMPT,
+                    json_mode=True,
+                    stop_when=closed_suggestions
+                )
+                parsed_response = extract_json_from_response(ai_response)
+                if not parsed_response:
+                    logger.warning(f"Could not extract JSON from AI response: {ai_response[:200]}...")
+                results = [parsed_response.get('suggestions', []) if parsed_response else None]
+            else:
+                logger.info(f"Analyzing {len(batch)} documents in one batched request")
+                # Union of each document's shortlist, in first-seen order
+                batch_lines = dict.fromkeys(line for _, _, lines, _ in batch for line in lines)
+                ai_response = await provider.complete(
+                    _build_batch_control_analysis_prompt(
+                        [(filename, file_text) for filename, file_text, _, _ in batch], _controls_table(batch_lines)
+                    ),
+                    max_tokens=min(4000, 400 * len(batch)),
+                    temperature=0.3,
+                    system=CONTROL_ANALYSIS_SYSTEM_PROMPT,
+                    json_mode=True,
+                    timeout=60 + 15 * (len(batch) - 1)
+                )
+                parsed_response = extract_json_from_response(ai_response)
+                if not parsed_response:
+                    logger.warning(f"Could not extract JSON from batched AI response: {ai_response[:200]}...")
+                by_doc = (parsed_response or {}).get('suggestions_by_doc') or []
+                results = [
+                    by_doc[i] if i < len(by_doc) and isinstance(by_doc[i], list) else None
+                    for i in range(len(batch))
+                ]
+
+            for (_, _, _, future), suggestions in zip(batch, results):
+                if not future.done():
+                    future.set_result(suggestions)
+        except Exception as e:
+            for _, _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+
+_suggestion_batcher = _SuggestionBatcher(
+    window=int(os.getenv("SUGGESTION_BATCH_WINDOW_MS", "80")) / 1000,
+    max_docs=int(os.getenv("SUGGESTION_BATCH_MAX_DOCS", "8"))
+)
+
 @app.post("/analyze-document-controls")
 async def analyze_document_controls(
     file: UploadFile = File(...),
@@ -3197,29 +3650,34 @@ async def analyze_document_controls(
 ):
     """Analyze uploaded document and suggest relevant compliance controls."""
     try:
-        # Read file content
-        file_content = await file.read()
+        # Parse available controls (memoized per payload; the same list is sent with every upload)
+        controls, control_lines, controls_index, controls_fingerprint = (
+            _controls_payload(available_controls) if available_controls else ([], (), None, "")
+        )
+        
+        # Nothing to suggest from, or a single control the filename already names: skip reading and the LLM
+        if not controls:
+            return {"suggested_controls": []}
+        filename_match = _filename_control_match(controls, file.filename)
+        if filename_match is not None:
+            return {"suggested_controls": filename_match}
+        
+        # Read file content. PDFs, Word files and images need the whole file; plain text
+        # only contributes a short preview and other types are judged by filename alone.
+        if file.content_type in FULL_READ_MIME_TYPES or (file.content_type or "").startswith("image/"):
+            file_content = await _read_capped(file)
+        else:
+            file_content = await file.read(TEXT_PREVIEW_BYTES)
         file_text = ""
         
         # Extract text based on file type
         if file.content_type == "text/plain":
-            file_text = file_content.decode('utf-8')
+            # The preview may end mid-character, so drop any partial trailing sequence
+            file_text = file_content.decode('utf-8', errors='ignore')
         elif file.content_type == "application/pdf":
             # Extract text from PDF
             try:
-                import fitz  # PyMuPDF
-                import io
-                
-                pdf_doc = fitz.open(stream=file_content, filetype="pdf")
-                text_pages = []
-                for page_num in range(min(3, pdf_doc.page_count)):  # First 3 pages
-                    page = pdf_doc[page_num]
-                    page_text = page.get_text()
-                    if page_text.strip():
-                        text_pages.append(f"Page {page_num + 1}: {page_text[:1000]}")
-                
-                pdf_doc.close()
-                file_text = "\n\n".join(text_pages)
+                file_text = await asyncio.get_running_loop().run_in_executor(_PDF_POOL, _extract_pdf_text, file_content)
                 if not file_text.strip():
                     file_text = f"PDF document: {file.filename} (text extraction failed)"
             except Exception as e:
@@ -3229,30 +3687,28 @@ async def analyze_document_controls(
         elif file.content_type and file.content_type.startswith("image/"):
             # Analyze image using AI vision
             try:
-                import base64
                 
                 # Convert image to base64 for AI analysis
                 image_b64 = base64.b64encode(file_content).decode('utf-8')
                 
                 # Use AI to describe the image content
-                from ai_scanner import get_ai_client
                 ai_client = get_ai_client()
                 
                 if isinstance(ai_client, dict) and ai_client.get('type') == 'ollama':
                     # Ollama with vision models (if available)
                     try:
-                        import requests
                         endpoint = ai_client['endpoint']
                         
                         # Try vision model first
-                        vision_response = requests.post(
+                        vision_response = await ollama_http.post(
                             f"{endpoint}/api/generate",
-                            json={
+                            content=orjson.dumps({
                                 "model": "llava",  # Vision model
                                 "prompt": f"Describe what you see in this image. Focus on any text, security-related content, error messages, configurations, or compliance-related information: {file.filename}",
                                 "images": [image_b64],
                                 "stream": False
-                            },
+                            }),
+                            headers=JSON_HEADERS,
                             timeout=30
                         )
                         
@@ -3268,7 +3724,8 @@ async def analyze_document_controls(
                 else:
                     # OpenAI GPT-4 Vision
                     try:
-                        response = ai_client.chat.completions.create(
+                        response = await asyncio.to_thread(
+                            ai_client.chat.completions.create,
                             model="gpt-4-vision-preview",
                             messages=[
                                 {
@@ -3301,16 +3758,8 @@ async def analyze_document_controls(
         elif file.content_type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
             # Extract text from Word documents
             try:
-                import docx
-                import io
-                
-                doc = docx.Document(io.BytesIO(file_content))
-                paragraphs = []
-                for para in doc.paragraphs:
-                    if para.text.strip():
-                        paragraphs.append(para.text)
-                
-                file_text = "\n".join(paragraphs[:20])  # First 20 paragraphs
+                pool = _DOCX_POOL if len(file_content) >= DOCX_PROCESS_MIN_BYTES else _PDF_POOL
+                file_text = await asyncio.get_running_loop().run_in_executor(pool, extract_docx_preview, file_content)
                 if not file_text.strip():
                     file_text = f"Word document: {file.filename} (text extraction failed)"
             except Exception as e:
@@ -3321,161 +3770,57 @@ async def analyze_document_controls(
             # For other file types, use filename
             file_text = f"Document: {file.filename}"
         
-        # Parse available controls
-        controls = []
-        if available_controls:
-            try:
-                controls = json_module.loads(available_controls)
-            except:
-                pass
-        
-        if not controls:
-            return {"suggested_controls": []}
-        
-        # Create analysis prompt
-        controls_context = "\n".join([
-            f"- {c.get('code', 'N/A')}: {c.get('title', 'N/A')} ({c.get('framework', 'N/A')}) - {c.get('description', 'N/A')[:500]}..."
-            for c in controls[:50]  # Increased from 10 to 50 controls with larger context
-        ])
-        
-        analysis_prompt = f"""
-Analyze this document and determine which compliance controls it might relate to:
-
-Document: {file.filename}
-Content preview: {file_text[:5000]}{'...' if len(file_text) > 5000 else ''}
-
-Available compliance controls:
-{controls_context}
-
-BE EXTREMELY STRICT with confidence scores. Use these guidelines:
-- 0.8-1.0: ONLY for explicit, comprehensive policy documents with clear compliance statements
-- 0.6-0.7: Strong documentation with specific compliance details
-- 0.4-0.5: Partial evidence or screenshots with limited context
-- 0.2-0.3: Weak evidence, filename-only matching, or requires significant interpretation
-- 0.0-0.1: No clear relevance
-
-CRITICAL: Screenshots or images alone should receive LOW confidence (0.2-0.4) unless they show comprehensive,
-unambiguous compliance with clear context.
-
-Respond in JSON format with a "suggestions" array containing objects with:
-- control_code: the control code
-- control_title: the control title
-- framework_name: the framework name
-- confidence: score from 0.0 to 1.0 (BE STRICT - most should be < 0.5)
-- reasoning: brief explanation
-
-Limit to the top 3 most relevant matches. If no relevant matches, return empty array.
-"""
-        
-        # Call AI analysis
-        from ai_scanner import get_ai_client
-        
-        ai_client = get_ai_client()
-        
-        if isinstance(ai_client, dict) and ai_client.get('type') == 'ollama':
-            # Handle Ollama
-            import requests
-            
-            endpoint = ai_client['endpoint']
-            model = ai_client['model']
-            
-            response = requests.post(
-                f"{endpoint}/api/generate",
-                json={
-                    "model": model,
-                    "prompt": analysis_prompt + """\n\nIMPORTANT: You must respond with ONLY valid JSON in this exact format:
-{{
-  "suggestions": [
-    {{
-      "control_code": "CONTROL_CODE",
-      "control_title": "Control Title",
-      "framework_name": "Framework Name", 
-      "confidence": 0.8,
-      "reasoning": "Brief explanation"
-    }}
-  ]
-}}
-
-Do not include any text before or after the JSON. Do not use markdown formatting. Return only the JSON object.""",
-                    "stream": False,
-                    "options": {
-                        "temperature": 0.3,
-                        "num_predict": 2000,
-                        "num_ctx": int(os.getenv("OLLAMA_CONTEXT_SIZE", "32768"))
-                    }
-                },
-                timeout=60
+        provider = get_ai_provider()
+        fast_provider = get_fast_ai_provider(provider)
+        # Answers are cached per model that produced them, so a fast-tier answer is never
+        # served as if it came from the configured model (or outlives a fast model change)
+        text_digest = hashlib.blake2b(file_text[:5000].encode(), digest_size=16).hexdigest()
+        candidate_models = ([fast_provider.model] if fast_provider is not None else []) + [provider.model]
+        if SUGGESTION_CACHE_ENABLED:
+            for model in candidate_models:
+                cached_suggestions = _suggestion_cache.get((text_digest, controls_fingerprint, model))
+                if cached_suggestions is not None:
+                    logger.info(f"Suggestion cache hit for {file.filename} ({model})")
+                    return {"suggested_controls": cached_suggestions}
+        
+        # Concurrent uploads against the same controls and model share one LLM call
+        # Only the controls that lexically match the document go into the prompt
+        shortlist = shortlist_controls(control_lines, controls_index, file_text, CONTROL_SHORTLIST_SIZE)
+        
+        # Try the small fast model first and escalate only when its answer is weak
+        valid_suggestions = None
+        answering_model = provider.model
+        if fast_provider is not None:
+            valid_suggestions = _validate_suggestions(
+                await _suggestion_batcher.analyze(
+                    (controls_fingerprint, fast_provider.model), fast_provider, shortlist, file.filename, file_text
+                ),
+                file.filename
             )
-            
-            if response.status_code == 200:
-                result = response.json()
-                ai_response = result.get('response', '')
-                
-                # Check thinking field if response is empty (some models use this field)
-                if not ai_response and 'thinking' in result:
-                    ai_response = result.get('thinking', '')
+            if _needs_escalation(valid_suggestions):
+                logger.info(f"Escalating {file.filename} from {fast_provider.model} to {provider.model}")
+                valid_suggestions = None
             else:
-                raise Exception(f"Ollama error: {response.status_code}")
-                
-        else:
-            # Handle OpenAI
-            model = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
-            
-            response = create_chat_completion_safe(
-                client=ai_client,
-                model=model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are a compliance expert that analyzes documents and suggests relevant compliance controls. Respond only with valid JSON."
-                    },
-                    {
-                        "role": "user", 
-                        "content": analysis_prompt
-                    }
-                ],
-                max_tokens=800,
-                temperature=0.3,
-                use_json_mode=True
+                answering_model = fast_provider.model
+        
+        if valid_suggestions is None:
+            valid_suggestions = _validate_suggestions(
+                await _suggestion_batcher.analyze(
+                    (controls_fingerprint, provider.model), provider, shortlist, file.filename, file_text
+                ),
+                file.filename
             )
-            
-            ai_response = response.choices[0].message.content
         
-        # Parse AI response
-        try:
-            # Use improved JSON extraction
-            parsed_response = _extract_json_from_response(ai_response)
-            if not parsed_response:
-                logger.warning(f"Could not extract JSON from AI response: {ai_response[:200]}...")
-                return {"suggested_controls": []}
-            
-            suggestions = parsed_response.get('suggestions', [])
-            
-            # Validate and clean suggestions
-            valid_suggestions = []
-            for suggestion in suggestions[:3]:  # Limit to top 3
-                if all(key in suggestion for key in ['control_code', 'control_title', 'confidence', 'reasoning']):
-                    # Ensure confidence is between 0 and 1
-                    confidence = max(0.0, min(1.0, float(suggestion.get('confidence', 0))))
-                    valid_suggestions.append({
-                        'control_code': str(suggestion['control_code']),
-                        'control_title': str(suggestion['control_title']),
-                        'framework_name': str(suggestion.get('framework_name', 'Unknown')),
-                        'confidence': confidence,
-                        'reasoning': str(suggestion['reasoning'])
-                    })
-            
-            return {"suggested_controls": valid_suggestions}
-            
-        except json_module.JSONDecodeError:
-            logger.warning(f"Failed to parse AI response as JSON: {ai_response[:200]}...")
+        if valid_suggestions is None:
             return {"suggested_controls": []}
         
+        if SUGGESTION_CACHE_ENABLED:
+            _suggestion_cache.set((text_digest, controls_fingerprint, answering_model), valid_suggestions)
+        return {"suggested_controls": valid_suggestions}
+        
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Document control analysis failed: {e}")
         # Return empty suggestions on error rather than failing  
-        return {"suggested_controls": []}
-        
-    finally:
-        # Reset file position for any subsequent reads
-        await file.seek(0)
\ No newline at end of file
+        return {"suggested_controls": []}
\ No newline at end of file
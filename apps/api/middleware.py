@@ -2,167 +2,302 @@
 Error handling and security middleware for the GeekyGoose Compliance API.
 """
 import logging
+import os
+import queue
+import random
 import time
-from typing import Callable
-from fastapi import Request, Response, HTTPException
-from fastapi.responses import JSONResponse
-from starlette.middleware.base import BaseHTTPMiddleware
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+import orjson
+from fastapi import HTTPException
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 from sqlalchemy.exc import SQLAlchemyError, IntegrityError
 from pydantic import ValidationError
 
 logger = logging.getLogger(__name__)
 
+# Per-request access lines go through their own logger so they can be handed
+# off to a background thread instead of hitting the log handlers on the event loop
+access_logger = logging.getLogger(f"{__name__}.access")
+ACCESS_LOG_QUEUE_SIZE = 10000
+# Fraction of successful (< 400) requests that get an access log line; errors are always logged
+ACCESS_LOG_SAMPLE_RATE = float(os.getenv("ACCESS_LOG_SAMPLE_RATE", "0.01"))
+# Probe endpoints polled by orchestrators, never access-logged
+_SKIP_PATHS = frozenset({"/health", "/metrics"})
+_access_log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize=ACCESS_LOG_QUEUE_SIZE)
+_access_log_listener: Optional[QueueListener] = None
 
-class ErrorHandlingMiddleware(BaseHTTPMiddleware):
+
+class _DeferredQueueHandler(QueueHandler):
+    """QueueHandler that leaves formatting to the listener thread and drops records when full."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass
+
+
+def start_access_log_listener() -> None:
+    """Write access log records from a background thread using the root logger's handlers."""
+    global _access_log_listener
+    handlers = logging.getLogger().handlers
+    if _access_log_listener is not None or not handlers:
+        return
+    _access_log_listener = QueueListener(_access_log_queue, *handlers, respect_handler_level=True)
+    _access_log_listener.start()
+    access_logger.addHandler(_DeferredQueueHandler(_access_log_queue))
+    access_logger.propagate = False
+
+
+def stop_access_log_listener() -> None:
+    """Flush queued access log records and go back to logging inline."""
+    global _access_log_listener
+    if _access_log_listener is None:
+        return
+    for handler in access_logger.handlers[:]:
+        if isinstance(handler, _DeferredQueueHandler):
+            access_logger.removeHandler(handler)
+    access_logger.propagate = True
+    _access_log_listener.stop()
+    _access_log_listener = None
+
+
+async def _send_json(send: Send, status_code: int, body: bytes) -> None:
+    """Send a complete JSON response whose body is already serialized."""
+    await send({
+        "type": "http.response.start",
+        "status": status_code,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+# Error payloads that don't depend on the request, serialized once at import
+_ERR_INTEGRITY = orjson.dumps({
+    "error": "Data Conflict",
+    "message": "The operation conflicts with existing data"
+})
+_ERR_DATABASE = orjson.dumps({
+    "error": "Database Error",
+    "message": "An internal database error occurred"
+})
+_ERR_FILE_NOT_FOUND = orjson.dumps({
+    "error": "File Not Found",
+    "message": "The requested file could not be found"
+})
+_ERR_PERMISSION = orjson.dumps({
+    "error": "Permission Denied",
+    "message": "You don't have permission to access this resource"
+})
+_ERR_INTERNAL = orjson.dumps({
+    "error": "Internal Server Error",
+    "message": "An unexpected error occurred. Please try again later."
+})
+
+
+class ErrorHandlingMiddleware:
     """
     Centralized error handling middleware to provide consistent error responses
     and prevent sensitive information leakage.
     """
-    
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        response_started = False
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
         try:
-            # Add request timing
-            start_time = time.time()
-            response = await call_next(request)
-            process_time = time.time() - start_time
-            response.headers["X-Process-Time"] = str(process_time)
-            return response
-            
-        except ValidationError as e:
-            logger.warning(f"Validation error for {request.url}: {e}")
-            return JSONResponse(
-                status_code=422,
-                content={
-                    "error": "Validation Error",
-                    "message": "Request data validation failed",
-                    "details": [{"field": err["loc"][-1], "message": err["msg"]} for err in e.errors()]
-                }
-            )
-            
-        except IntegrityError as e:
-            logger.warning(f"Database integrity error for {request.url}: {e}")
-            return JSONResponse(
-                status_code=409,
-                content={
-                    "error": "Data Conflict",
-                    "message": "The operation conflicts with existing data"
-                }
-            )
-            
-        except SQLAlchemyError as e:
-            logger.error(f"Database error for {request.url}: {e}")
-            return JSONResponse(
-                status_code=500,
-                content={
-                    "error": "Database Error",
-                    "message": "An internal database error occurred"
-                }
-            )
-            
-        except HTTPException as e:
+            await self.app(scope, receive, send_wrapper)
+        except HTTPException:
             # Re-raise HTTP exceptions to let FastAPI handle them
-            raise e
-            
-        except FileNotFoundError as e:
-            logger.error(f"File not found for {request.url}: {e}")
-            return JSONResponse(
-                status_code=404,
-                content={
-                    "error": "File Not Found",
-                    "message": "The requested file could not be found"
-                }
-            )
-            
-        except PermissionError as e:
-            logger.error(f"Permission error for {request.url}: {e}")
-            return JSONResponse(
-                status_code=403,
-                content={
-                    "error": "Permission Denied",
-                    "message": "You don't have permission to access this resource"
-                }
-            )
-            
+            raise
         except Exception as e:
-            # Log the full error for debugging, but return generic message to client
-            logger.error(f"Unexpected error for {request.url}: {type(e).__name__}: {e}", exc_info=True)
-            return JSONResponse(
-                status_code=500,
-                content={
-                    "error": "Internal Server Error",
-                    "message": "An unexpected error occurred. Please try again later."
-                }
-            )
-
-
-class SecurityHeadersMiddleware(BaseHTTPMiddleware):
+            # Once headers are on the wire there is no way to swap in an error body
+            if response_started:
+                raise
+            status_code, body = self._error_response(scope["path"], e)
+            await _send_json(send, status_code, body)
+
+    @staticmethod
+    def _error_response(path: str, e: Exception) -> tuple:
+        """Log the error and return the (status code, JSON body) to send for it."""
+        if isinstance(e, ValidationError):
+            logger.warning(f"Validation error for {path}: {e}")
+            return 422, orjson.dumps({
+                "error": "Validation Error",
+                "message": "Request data validation failed",
+                "details": [{"field": err["loc"][-1], "message": err["msg"]} for err in e.errors()]
+            })
+
+        if isinstance(e, IntegrityError):
+            logger.warning(f"Database integrity error for {path}: {e}")
+            return 409, _ERR_INTEGRITY
+
+        if isinstance(e, SQLAlchemyError):
+            logger.error(f"Database error for {path}: {e}")
+            return 500, _ERR_DATABASE
+
+        if isinstance(e, FileNotFoundError):
+            logger.error(f"File not found for {path}: {e}")
+            return 404, _ERR_FILE_NOT_FOUND
+
+        if isinstance(e, PermissionError):
+            logger.error(f"Permission error for {path}: {e}")
+            return 403, _ERR_PERMISSION
+
+        # Log the full error for debugging, but return generic message to client
+        logger.error(f"Unexpected error for {path}: {type(e).__name__}: {e}", exc_info=True)
+        return 500, _ERR_INTERNAL
+
+
+def _raw_headers(message: Message) -> list:
+    """Return the start message's header list, making it appendable."""
+    headers = message.setdefault("headers", [])
+    if not isinstance(headers, list):
+        # ASGI allows any iterable of header pairs here
+        headers = message["headers"] = list(headers)
+    return headers
+
+
+# Security headers, encoded once and appended as raw ASGI header pairs.
+# None of the routes set these themselves, so appending never duplicates.
+_SECURITY_HEADERS = (
+    (b"x-content-type-options", b"nosniff"),
+    (b"x-frame-options", b"DENY"),
+    (b"x-xss-protection", b"1; mode=block"),
+    (b"strict-transport-security", b"max-age=31536000; includeSubDomains"),
+    (b"referrer-policy", b"strict-origin-when-cross-origin"),
+    (b"content-security-policy", b"default-src 'self'"),
+)
+
+
+class SecurityHeadersMiddleware:
     """
     Adds security headers to all responses.
     """
-    
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
-        response = await call_next(request)
-        
-        # Security headers
-        response.headers["X-Content-Type-Options"] = "nosniff"
-        response.headers["X-Frame-Options"] = "DENY"
-        response.headers["X-XSS-Protection"] = "1; mode=block"
-        response.headers["Strict-Transport-Security"] = "max-age=31536000; includeSubDomains"
-        response.headers["Referrer-Policy"] = "strict-origin-when-cross-origin"
-        response.headers["Content-Security-Policy"] = "default-src 'self'"
-        
-        return response
-
-
-class RequestValidationMiddleware(BaseHTTPMiddleware):
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                _raw_headers(message).extend(_SECURITY_HEADERS)
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+
+# Upload routes that get the extra multipart checks below
+_DOC_UPLOAD_PREFIX = "/api/documents"
+
+
+class RequestValidationMiddleware:
     """
     Validates request size and content type for security.
     """
-    
+
     MAX_REQUEST_SIZE = 50 * 1024 * 1024  # 50MB max request size
-    
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
+    _TOO_LARGE_BODY = orjson.dumps({
+        "error": "Request Too Large",
+        "message": f"Request size exceeds maximum allowed size of {MAX_REQUEST_SIZE} bytes"
+    })
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        # Raw header names arrive lower-cased, so compare bytes without building a Headers object
+        content_length = None
+        content_type = b""
+        for name, value in scope["headers"]:
+            if name == b"content-length":
+                content_length = value
+            elif name == b"content-type":
+                content_type = value
+
         # Check request size
-        content_length = request.headers.get("content-length")
         if content_length and int(content_length) > self.MAX_REQUEST_SIZE:
-            client_host = request.client.host if request.client else "unknown"
-            logger.warning(f"Request size too large: {content_length} bytes from {client_host}")
-            return JSONResponse(
-                status_code=413,
-                content={
-                    "error": "Request Too Large",
-                    "message": f"Request size exceeds maximum allowed size of {self.MAX_REQUEST_SIZE} bytes"
-                }
-            )
-        
+            client_host = (scope.get("client") or ("unknown", 0))[0]
+            logger.warning(f"Request size too large: {content_length.decode()} bytes from {client_host}")
+            await _send_json(send, 413, self._TOO_LARGE_BODY)
+            return
+
         # Validate file upload content types
-        if request.url.path.startswith("/api/documents") and request.method == "POST":
-            content_type = request.headers.get("content-type", "")
-            if content_type.startswith("multipart/form-data"):
+        if scope["method"] == "POST" and scope["path"].startswith(_DOC_UPLOAD_PREFIX):
+            if content_type.startswith(b"multipart/form-data"):
                 # Additional validation can be added here for file uploads
                 pass
-        
-        return await call_next(request)
+
+        await self.app(scope, receive, send)
 
 
-class RequestLoggingMiddleware(BaseHTTPMiddleware):
+class RequestLoggingMiddleware:
     """
-    Logs all API requests for monitoring and security.
+    Logs API requests for monitoring and security: every error response,
+    plus a sample of successful ones.
     """
-    
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
-        start_time = time.time()
-        
-        # Log request
-        logger.info(f"{request.method} {request.url.path} - Client: {request.client.host if request.client else 'unknown'}")
-        
-        response = await call_next(request)
-        
-        # Log response
-        process_time = time.time() - start_time
-        logger.info(f"{request.method} {request.url.path} - Status: {response.status_code} - Time: {process_time:.3f}s")
-        
-        return response
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        path = scope["path"]
+        start_time = time.monotonic()
+        status_code = 500
+        process_time = None
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code, process_time
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                # Time to first byte; reused for the log line below
+                process_time = time.monotonic() - start_time
+                _raw_headers(message).append((b"x-process-time", b"%.6f" % process_time))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # Probe endpoints still get X-Process-Time but are never logged
+            if path not in _SKIP_PATHS and (status_code >= 400 or random.random() < ACCESS_LOG_SAMPLE_RATE):
+                if process_time is None:
+                    process_time = time.monotonic() - start_time
+                access_logger.info(
+                    "%s %s - Client: %s - Status: %d - Time: %.3fs",
+                    scope["method"], path, (scope.get("client") or ("unknown", 0))[0],
+                    status_code, process_time,
+                )
 
 
 # Exception classes for better error handling
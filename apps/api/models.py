@@ -1,6 +1,6 @@
 import uuid
-from sqlalchemy import Column, String, DateTime, Integer, Text, BigInteger, ForeignKey, Float, Index
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import Column, String, DateTime, Integer, Text, BigInteger, ForeignKey, Float, Index, Boolean
+from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy.orm import relationship, DeclarativeBase
 from datetime import datetime
 
@@ -58,6 +58,11 @@ class Control(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow)
     
+    # Performance: Controls are listed per framework
+    __table_args__ = (
+        Index('idx_controls_framework_id', 'framework_id'),
+    )
+    
     framework = relationship("Framework", back_populates="controls")
     requirements = relationship("Requirement", back_populates="control")
 
@@ -73,6 +78,11 @@ class Requirement(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow)
     
+    # Performance: Requirements are loaded per control
+    __table_args__ = (
+        Index('idx_requirements_control_id', 'control_id'),
+    )
+    
     control = relationship("Control", back_populates="requirements")
 
 class Document(Base):
@@ -136,6 +146,8 @@ class EvidenceLink(Base):
         Index('idx_evidence_link_control_id', 'control_id'),
         Index('idx_evidence_link_document_id', 'document_id'),
         Index('idx_evidence_link_org_id', 'org_id'),
+        Index('idx_evidence_link_org_control', 'org_id', 'control_id'),
+        Index('idx_evidence_links_dedup', 'document_id', 'control_id', 'requirement_id'),
         Index('idx_evidence_link_requirement_id', 'requirement_id'),
     )
 
@@ -188,6 +200,7 @@ class Scan(Base):
         Index('idx_scan_control_id', 'control_id'),
         Index('idx_scan_status', 'status'),
         Index('idx_scan_created_at', 'created_at'),
+        Index('idx_scans_control_created', 'control_id', created_at.desc()),
     )
 
     org = relationship("Org")
@@ -202,9 +215,9 @@ class ScanResult(Base):
     scan_id = Column(UUID(as_uuid=True), ForeignKey("scans.id"), nullable=False)
     requirement_id = Column(UUID(as_uuid=True), ForeignKey("requirements.id"), nullable=False)
     outcome = Column(String(20), nullable=False)  # PASS, PARTIAL, FAIL, NOT_FOUND
-    confidence = Column(String(10), nullable=False)  # stored as string "0.85" etc
-    rationale_json = Column(Text)  # JSON string
-    citations_json = Column(Text)  # JSON string
+    confidence = Column(Float, nullable=False)
+    rationale_json = Column(JSONB)
+    citations_json = Column(JSONB)
     created_at = Column(DateTime, default=datetime.utcnow)
 
     # Performance: Add indexes for scan result queries
@@ -224,7 +237,7 @@ class Gap(Base):
     scan_id = Column(UUID(as_uuid=True), ForeignKey("scans.id"), nullable=False)
     requirement_id = Column(UUID(as_uuid=True), ForeignKey("requirements.id"), nullable=False)
     gap_summary = Column(Text, nullable=False)
-    recommended_actions_json = Column(Text)  # JSON string
+    recommended_actions_json = Column(JSONB)
     created_at = Column(DateTime, default=datetime.utcnow)
 
     # Performance: Add indexes for gap queries
@@ -245,7 +258,7 @@ class AuditLog(Base):
     action = Column(String(100), nullable=False)
     entity_type = Column(String(50), nullable=False)
     entity_id = Column(String(100), nullable=False)
-    meta_json = Column(Text)  # JSON string
+    meta_json = Column(JSONB)
     created_at = Column(DateTime, default=datetime.utcnow)
 
     org = relationship("Org")
@@ -265,6 +278,6 @@ class Settings(Base):
     ollama_vision_model = Column(String(100), default='qwen2-vl')
     ollama_context_size = Column(Integer, default=131072)
     min_confidence_threshold = Column(Float, default=0.90)
-    use_dual_vision_validation = Column(Integer, default=0)  # SQLite boolean (0/1)
+    use_dual_vision_validation = Column(Boolean, default=False)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
\ No newline at end of file
@@ -1,9 +1,13 @@
 import os
 import hashlib
 import uuid
+import time
+import threading
+from collections import OrderedDict
 from typing import BinaryIO, Optional
 import boto3
 from botocore.client import Config
+from botocore.exceptions import ClientError
 
 class MinIOStorage:
     def __init__(self):
@@ -22,6 +26,10 @@ class MinIOStorage:
             region_name='us-east-1'
         )
         
+        # Presigned URLs by (storage_key, expires_in) -> (reuse deadline, url)
+        self._url_cache: OrderedDict = OrderedDict()
+        self._url_cache_lock = threading.Lock()
+        
         # Create bucket if it doesn't exist
         try:
             self.client.head_bucket(Bucket=self.bucket)
@@ -29,42 +37,70 @@ class MinIOStorage:
             self.client.create_bucket(Bucket=self.bucket)
     
     def upload_file(self, file: BinaryIO, filename: str, mime_type: Optional[str] = None) -> tuple[str, str, int]:
-        """Upload file and return (storage_key, sha256_hash, file_size)"""
-        # Read file content
-        file_content = file.read()
-        file_size = len(file_content)
+        """Upload a seekable file and return (storage_key, sha256_hash, file_size)"""
+        # Hash in 1 MiB chunks instead of reading the whole file into memory
+        start = file.tell()
+        hasher = hashlib.sha256()
+        file_size = 0
+        while chunk := file.read(1024 * 1024):
+            hasher.update(chunk)
+            file_size += len(chunk)
+        sha256_hash = hasher.hexdigest()
+        file.seek(start)
         
-        # Calculate SHA256
-        sha256_hash = hashlib.sha256(file_content).hexdigest()
+        storage_key = self.upload_stream(file, filename, mime_type)
         
-        # Generate unique storage key
+        return storage_key, sha256_hash, file_size
+    
+    def upload_stream(self, file: BinaryIO, filename: str, mime_type: Optional[str] = None) -> str:
+        """Upload an already hashed and size-checked file object without reading it into memory; return storage_key"""
         storage_key = f"{uuid.uuid4()}/{filename}"
         
-        # Upload to MinIO
         extra_args = {}
         if mime_type:
             extra_args['ContentType'] = mime_type
-            
-        self.client.put_object(
-            Bucket=self.bucket,
-            Key=storage_key,
-            Body=file_content,
-            **extra_args
-        )
         
-        return storage_key, sha256_hash, file_size
+        # upload_fileobj streams the body in parts rather than as one bytes object
+        self.client.upload_fileobj(file, self.bucket, storage_key, ExtraArgs=extra_args)
+        
+        return storage_key
     
     def get_download_url(self, storage_key: str, expires_in: int = 3600) -> str:
-        """Generate presigned URL for file download"""
-        return self.client.generate_presigned_url(
+        """Generate presigned URL for file download, reusing one while over half its lifetime remains"""
+        cache_key = (storage_key, expires_in)
+        cached = self._url_cache.get(cache_key)
+        now = time.monotonic()
+        if cached is not None and cached[0] > now:
+            return cached[1]
+        
+        url = self.client.generate_presigned_url(
             'get_object',
             Params={'Bucket': self.bucket, 'Key': storage_key},
             ExpiresIn=expires_in
         )
+        with self._url_cache_lock:
+            self._url_cache[cache_key] = (now + expires_in / 2, url)
+            self._url_cache.move_to_end(cache_key)
+            while len(self._url_cache) > 1024:
+                self._url_cache.popitem(last=False)
+        return url
+    
+    def get_download_urls(self, storage_keys, expires_in: int = 3600) -> dict[str, str]:
+        """Presigned download URLs for several keys at once, signing each distinct key only once"""
+        return {key: self.get_download_url(key, expires_in) for key in dict.fromkeys(storage_keys)}
     
-    def download_file(self, storage_key: str) -> bytes:
-        """Download file content from storage"""
-        response = self.client.get_object(Bucket=self.bucket, Key=storage_key)
+    def download_file(self, storage_key: str, max_bytes: Optional[int] = None) -> bytes:
+        """Download file content from storage, or only its first max_bytes bytes"""
+        if max_bytes is None:
+            response = self.client.get_object(Bucket=self.bucket, Key=storage_key)
+        else:
+            try:
+                response = self.client.get_object(Bucket=self.bucket, Key=storage_key, Range=f"bytes=0-{max_bytes - 1}")
+            except ClientError as e:
+                # A ranged GET on a zero-byte object is rejected as unsatisfiable
+                if e.response.get('Error', {}).get('Code') == 'InvalidRange':
+                    return b""
+                raise
         return response['Body'].read()
     
     def delete_file(self, storage_key: str):
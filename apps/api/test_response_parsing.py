@@ -0,0 +1,119 @@
+"""
+Tests for the hand-written LLM response parsers (json_extract) and the BM25 control
+shortlist (control_ranking).
+"""
+from control_ranking import BM25Index, shortlist_controls
+from json_extract import balanced_json_spans, closed_suggestions, extract_json_from_response
+
+
+# balanced_json_spans
+
+def _spans(text, start=0):
+    return [text[begin:end] for begin, end in balanced_json_spans(text, start)]
+
+def test_balanced_spans_ignore_braces_inside_strings():
+    # The outer object balances despite the stray brace; nested regions follow as fallbacks
+    assert _spans('Result: {"reasoning": "uses {braces} and }"} done')[0] == '{"reasoning": "uses {braces} and }"}'
+
+def test_balanced_spans_handle_escaped_quotes():
+    text = r'x {"reasoning": "he said \"}\" twice", "n": 1} y'
+    assert _spans(text) == [r'{"reasoning": "he said \"}\" twice", "n": 1}']
+
+def test_balanced_spans_yield_each_top_level_object():
+    assert _spans('{"a": {"b": 1}} and {"c": 2}') == ['{"a": {"b": 1}}', '{"b": 1}', '{"c": 2}']
+
+def test_balanced_spans_stop_on_truncated_stream():
+    assert _spans('{"suggestions": [{"control_code": "A1"}') == []
+
+def test_balanced_spans_skip_non_object_top_level():
+    assert _spans('[1, 2, 3]') == []
+    assert _spans('"just text"') == []
+
+def test_balanced_spans_start_offset():
+    assert _spans('{"a": 1} {"b": 2}', start=1) == ['{"b": 2}']
+
+
+# extract_json_from_response
+
+def test_extract_plain_object():
+    assert extract_json_from_response('{"suggestions": []}') == {"suggestions": []}
+
+def test_extract_fenced_json_block():
+    text = 'Here is the analysis:\n```json\n{"suggestions": [{"control_code": "EE-1"}]}\n```'
+    assert extract_json_from_response(text) == {"suggestions": [{"control_code": "EE-1"}]}
+
+def test_extract_fenced_block_skips_braces_in_preceding_prose():
+    text = 'Use {placeholders} like {this}.\n```json\n{"a": 1}\n```'
+    assert extract_json_from_response(text) == {"a": 1}
+
+def test_extract_braces_inside_strings():
+    text = 'Answer: {"reasoning": "mentions {MFA} and }", "confidence": 0.9} thanks'
+    assert extract_json_from_response(text) == {"reasoning": "mentions {MFA} and }", "confidence": 0.9}
+
+def test_extract_escaped_quotes():
+    text = r'Answer: {"reasoning": "policy says \"enforce}\"", "confidence": 0.8}'
+    assert extract_json_from_response(text) == {"reasoning": 'policy says "enforce}"', "confidence": 0.8}
+
+def test_extract_truncated_stream():
+    assert extract_json_from_response('{"suggestions": [{"control_code": "A1", "confid') is None
+
+def test_extract_non_object_top_level():
+    assert extract_json_from_response('[1, 2, 3]') is None
+    assert extract_json_from_response('"no json here"') is None
+    assert extract_json_from_response('') is None
+
+
+# closed_suggestions
+
+def test_closed_suggestions_waits_for_array_to_close():
+    assert closed_suggestions('{"suggestions": [{"control_code": "A1"}') is None
+    assert closed_suggestions('{"summary": "still thinking') is None
+
+def test_closed_suggestions_drops_trailing_text():
+    text = '{"suggestions": [{"control_code": "A1"}, {"control_code": "B2"}], "notes": "long expl'
+    assert closed_suggestions(text) == '{"suggestions": [{"control_code": "A1"}, {"control_code": "B2"}]}'
+
+def test_closed_suggestions_ignores_brackets_inside_strings():
+    text = '{"suggestions": [{"reasoning": "see ] and } here"}], "x'
+    assert closed_suggestions(text) == '{"suggestions": [{"reasoning": "see ] and } here"}]}'
+
+def test_closed_suggestions_handles_escaped_quotes():
+    text = r'{"suggestions": [{"reasoning": "a \"]\" b"}]' + ' trailing'
+    assert closed_suggestions(text) == r'{"suggestions": [{"reasoning": "a \"]\" b"}]}'
+
+def test_closed_suggestions_leaves_fenced_reply_to_full_parse():
+    # The prefix is not a plain JSON object, so the stream is read to the end instead
+    assert closed_suggestions('```json\n{"suggestions": []}\n```') is None
+
+def test_closed_suggestions_non_object_top_level():
+    assert closed_suggestions('[{"suggestions": [1]}]') is None
+
+
+# BM25Index and shortlist_controls
+
+def test_bm25_ranks_rare_term_matches_first():
+    index = BM25Index([
+        "backup policy for servers",
+        "multi-factor authentication for privileged users",
+        "application control for servers",
+    ])
+    assert index.top_n("All privileged users must use multi-factor authentication", 3) == [1]
+
+def test_bm25_ties_keep_document_order():
+    index = BM25Index(["patch applications", "patch applications", "patch applications", "restrict macros"])
+    assert index.top_n("patch applications weekly", 2) == [0, 1]
+
+def test_bm25_no_shared_terms():
+    index = BM25Index(["backup policy", "user application hardening"])
+    assert index.top_n("quarterly financial statements", 5) == []
+    assert index.top_n("the and of", 5) == []
+
+def test_shortlist_falls_back_without_shared_terms():
+    control_lines = tuple(f"C-{i}|Control {i}|Framework|backup policy" for i in range(60))
+    index = BM25Index(["backup policy"] * 60)
+    assert shortlist_controls(control_lines, index, "quarterly financial statements", 8) == control_lines[:50]
+
+def test_shortlist_uses_ranked_controls():
+    control_lines = ("EE-1|Backups", "EE-2|MFA", "EE-3|Patching")
+    index = BM25Index(["regular backups", "multi-factor authentication", "patch operating systems"])
+    assert shortlist_controls(control_lines, index, "We enforce multi-factor authentication", 8) == ("EE-2|MFA",)
@@ -229,5 +229,25 @@ class TextExtractor:
         
         return chunks
 
+# Worker-process entry points for the API's process pools. They live here rather than in
+# main so forkserver children only import the extraction libraries, not the whole app.
+
+def ocr_image_bytes(content: bytes) -> str:
+    """Run Tesseract OCR over raw image bytes."""
+    return pytesseract.image_to_string(Image.open(io.BytesIO(content)))
+
+def extract_docx_preview(content: bytes, max_paragraphs: int = 20, max_chars: int = 8192) -> str:
+    """Extract the first non-empty paragraphs of a Word document, up to ~max_chars."""
+    doc = DocxDocument(io.BytesIO(content))
+    paragraphs = []
+    total_chars = 0
+    for para in doc.paragraphs:
+        if para.text.strip():
+            paragraphs.append(para.text)
+            total_chars += len(para.text)
+            if len(paragraphs) >= max_paragraphs or total_chars >= max_chars:
+                break
+    return "\n".join(paragraphs)
+
 # Global extractor instance
 text_extractor = TextExtractor()
\ No newline at end of file
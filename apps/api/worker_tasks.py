@@ -1,10 +1,13 @@
 """
 Celery worker tasks for document processing and AI scanning.
 """
-import json
 import logging
+from collections import defaultdict
 from typing import List, Dict, Any
+import orjson
 from celery_app import celery_app
+from sqlalchemy import update
+from sqlalchemy.orm import joinedload, selectinload
 from database import SessionLocal
 from models import Document, DocumentPage, Scan, ScanResult, Gap, Requirement, Control, EvidenceLink, DocumentControlLink
 from text_extraction import text_extractor
@@ -13,6 +16,51 @@ from storage import storage
 
 logger = logging.getLogger(__name__)
 
+# Failures a retry cannot fix (missing rows or stored files); anything else is retried.
+# ValueError is deliberately not here: ai_scanner raises it when Ollama is unreachable.
+_PERMANENT_ERRORS = (LookupError, FileNotFoundError)
+
+def _update_scan_progress(db, scan_id, percentage: int, step: str, **values) -> None:
+    """
+    Publish a scan phase with a single-row UPDATE and commit it so pollers see it.
+    Extra keyword arguments set further Scan columns in the same statement.
+    """
+    db.execute(
+        update(Scan)
+        .where(Scan.id == scan_id)
+        .values(progress_percentage=percentage, current_step=step, **values)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+
+def _mark_scan_failed(scan_id: str, error: Exception) -> None:
+    """Record a scan failure from a fresh session, so a broken task session can't mask the original error."""
+    err_db = SessionLocal()
+    try:
+        err_db.execute(
+            update(Scan)
+            .where(Scan.id == scan_id)
+            .values(status='failed', current_step=f'Error: {str(error)[:100]}')
+        )
+        err_db.commit()
+    except Exception as status_error:
+        logger.error(f"Could not mark scan {scan_id} as failed: {status_error}")
+        err_db.rollback()
+    finally:
+        err_db.close()
+
+def _normalize_recommended_actions(recommended_actions: Any) -> Any:
+    """Coerce a gap's recommended actions to a JSON value, parsing JSON strings and dropping anything else."""
+    if isinstance(recommended_actions, (list, dict)):
+        return recommended_actions
+    if isinstance(recommended_actions, str):
+        # The model sometimes returns the list as a JSON document
+        try:
+            return orjson.loads(recommended_actions)
+        except orjson.JSONDecodeError:
+            pass
+    return []
+
 @celery_app.task(bind=True)
 def extract_document_text(self, document_id: str):
     """
@@ -23,7 +71,7 @@ def extract_document_text(self, document_id: str):
         # Get document from database
         document = db.query(Document).filter(Document.id == document_id).first()
         if not document:
-            raise ValueError(f"Document {document_id} not found")
+            raise LookupError(f"Document {document_id} not found")
         
         logger.info(f"Starting text extraction for document {document.filename}")
         
@@ -37,14 +85,16 @@ def extract_document_text(self, document_id: str):
             document.mime_type
         )
         
-        # Store extracted text in database
-        for page_data in pages:
-            doc_page = DocumentPage(
-                document_id=document.id,
-                page_num=page_data["page_num"],
-                text=page_data["text"]
+        # Store extracted text in database with one multi-row INSERT rather than
+        # one ORM object and statement per page
+        if pages:
+            db.execute(
+                DocumentPage.__table__.insert(),
+                [
+                    {"document_id": document.id, "page_num": page_data["page_num"], "text": page_data["text"]}
+                    for page_data in pages
+                ]
             )
-            db.add(doc_page)
         
         db.commit()
         
@@ -59,6 +109,8 @@ def extract_document_text(self, document_id: str):
     except Exception as e:
         logger.error(f"Error extracting text for document {document_id}: {str(e)}")
         db.rollback()
+        if isinstance(e, _PERMANENT_ERRORS):
+            raise
         raise self.retry(exc=e, countdown=60, max_retries=3)
     finally:
         db.close()
@@ -68,12 +120,17 @@ def process_scan(self, scan_id: str):
     """
     Process a compliance scan using AI.
     """
-    db = SessionLocal()
+    # The progress commits below would otherwise expire the scan, control,
+    # requirements and evidence links, re-selecting each one on next access
+    db = SessionLocal(expire_on_commit=False)
     try:
         # Get scan from database
-        scan = db.query(Scan).filter(Scan.id == scan_id).first()
+        # (with its control and the control's requirements, so they need no further round trips)
+        scan = db.query(Scan).options(
+            joinedload(Scan.control).selectinload(Control.requirements)
+        ).filter(Scan.id == scan_id).first()
         if not scan:
-            raise ValueError(f"Scan {scan_id} not found")
+            raise LookupError(f"Scan {scan_id} not found")
         
         logger.info(f"Starting compliance scan {scan_id} for control {scan.control.code}")
 
@@ -92,84 +149,73 @@ def process_scan(self, scan_id: str):
 
         # Get control and requirements first to set total
         control = scan.control
-        requirements = db.query(Requirement).filter(Requirement.control_id == control.id).all()
+        requirements = list(control.requirements)
 
         # Update scan status with initial progress
-        scan.status = 'processing'
-        scan.model = model_name
-        scan.prompt_version = 'v1.0'
-        scan.progress_percentage = 0
-        scan.current_step = 'Initializing scan...'
-        scan.total_requirements = len(requirements)
-        scan.processed_requirements = 0
-        db.commit()
+        _update_scan_progress(
+            db, scan.id, 0, 'Initializing scan...',
+            status='processing',
+            model=model_name,
+            prompt_version='v1.0',
+            total_requirements=len(requirements),
+            processed_requirements=0
+        )
         
         # Get linked evidence documents (both manual and AI-linked)
-        # Manual evidence links
-        manual_evidence_links = db.query(EvidenceLink).filter(
+        # Manual evidence links (document filenames are loaded up front for the evidence list below)
+        manual_evidence_links = db.query(EvidenceLink).options(
+            selectinload(EvidenceLink.document).load_only(Document.filename)
+        ).filter(
             EvidenceLink.org_id == scan.org_id,
             EvidenceLink.control_id == control.id
         ).all()
 
         # AI-linked evidence
-        ai_evidence_links = db.query(DocumentControlLink).filter(
+        ai_evidence_links = db.query(DocumentControlLink).options(
+            selectinload(DocumentControlLink.document).load_only(Document.filename)
+        ).filter(
             DocumentControlLink.control_id == control.id
         ).all()
 
-        total_evidence = len(manual_evidence_links) + len(ai_evidence_links)
+        # A document can be linked manually, by AI, or to several requirements at once;
+        # send each one to the model only once (manual links first, as before)
+        document_names = {}
+        for link in manual_evidence_links + ai_evidence_links:
+            document_names.setdefault(link.document_id, link.document.filename)
+        total_evidence = len(document_names)
 
         if total_evidence == 0:
             logger.warning(f"No evidence linked to control {control.code} for scan {scan_id}")
-            scan.status = 'completed'
-            scan.progress_percentage = 100
-            scan.current_step = 'No evidence to scan'
-            db.commit()
+            _update_scan_progress(db, scan.id, 100, 'No evidence to scan', status='completed')
             return {"status": "completed", "message": "No evidence to scan"}
 
         logger.info(f"Found {len(manual_evidence_links)} manual + {len(ai_evidence_links)} AI-linked evidence for control {control.code}")
 
         # Update progress: gathering evidence
-        scan.progress_percentage = 10
-        scan.current_step = f'Gathering evidence from {total_evidence} documents...'
-        db.commit()
-
-        # Gather evidence text from both sources
-        evidence_texts = []
+        _update_scan_progress(db, scan.id, 10, f'Gathering evidence from {total_evidence} documents...')
 
-        # Process manual evidence links
-        for link in manual_evidence_links:
-            document_pages = db.query(DocumentPage).filter(
-                DocumentPage.document_id == link.document_id
-            ).all()
+        # Gather evidence text from both sources, loading the pages of every
+        # linked document in one query instead of one query per document
+        pages_by_document = defaultdict(list)
+        document_pages = db.query(DocumentPage).filter(
+            DocumentPage.document_id.in_(document_names.keys())
+        ).order_by(DocumentPage.page_num).all()
+        for page in document_pages:
+            pages_by_document[page.document_id].append(page)
 
-            for page in document_pages:
-                if page.text:
-                    evidence_texts.append({
-                        "document_id": str(link.document_id),
-                        "document_name": link.document.filename,
-                        "page_num": page.page_num,
-                        "text": page.text
-                    })
-
-        # Process AI-linked evidence
-        for link in ai_evidence_links:
-            document_pages = db.query(DocumentPage).filter(
-                DocumentPage.document_id == link.document_id
-            ).all()
-
-            for page in document_pages:
+        evidence_texts = []
+        for document_id, document_name in document_names.items():
+            for page in pages_by_document[document_id]:
                 if page.text:
                     evidence_texts.append({
-                        "document_id": str(link.document_id),
-                        "document_name": link.document.filename,
+                        "document_id": str(document_id),
+                        "document_name": document_name,
                         "page_num": page.page_num,
                         "text": page.text
                     })
 
         # Update progress: starting AI analysis
-        scan.progress_percentage = 20
-        scan.current_step = f'Analyzing {len(requirements)} requirements with AI...'
-        db.commit()
+        _update_scan_progress(db, scan.id, 20, f'Analyzing {len(requirements)} requirements with AI...')
 
         # Run AI scan
         scan_results = compliance_scanner.scan_control(
@@ -179,56 +225,41 @@ def process_scan(self, scan_id: str):
         )
 
         # Update progress: AI analysis complete
-        scan.progress_percentage = 80
-        scan.current_step = 'Storing scan results...'
-        db.commit()
+        _update_scan_progress(db, scan.id, 80, 'Storing scan results...')
         
-        # Store scan results
-        for result in scan_results["requirements"]:
-            # JSON-encode for SQLAlchemy JSONB adapter
-            rationale_json = json.dumps(result.get("rationale", ""))
-            citations_json = json.dumps(result.get("citations", []))
-            
-            scan_result = ScanResult(
-                scan_id=scan.id,
-                requirement_id=result["requirement_id"],
-                outcome=result["outcome"],
-                confidence=str(result["confidence"]),
-                rationale_json=rationale_json,
-                citations_json=citations_json
-            )
-            db.add(scan_result)
+        # Store scan results and gaps as two multi-row INSERTs
+        result_rows = [
+            {
+                "scan_id": scan.id,
+                "requirement_id": result["requirement_id"],
+                "outcome": result["outcome"],
+                "confidence": float(result["confidence"]),
+                "rationale_json": result.get("rationale", ""),
+                "citations_json": result.get("citations", [])
+            }
+            for result in scan_results["requirements"]
+        ]
+        if result_rows:
+            db.execute(ScanResult.__table__.insert(), result_rows)
         
-        # Store gaps
-        for gap in scan_results["gaps"]:
-            # Ensure recommended_actions is properly serialized
-            recommended_actions = gap.get("recommended_actions", [])
-            if isinstance(recommended_actions, (list, dict)):
-                recommended_actions_json = json.dumps(recommended_actions)
-            elif isinstance(recommended_actions, str):
-                # Try to parse and re-serialize to ensure valid JSON
-                try:
-                    parsed = json.loads(recommended_actions)
-                    recommended_actions_json = json.dumps(parsed)
-                except json.JSONDecodeError:
-                    recommended_actions_json = json.dumps([])
-            else:
-                recommended_actions_json = json.dumps([])
-            
-            gap_record = Gap(
-                scan_id=scan.id,
-                requirement_id=gap["requirement_id"],
-                gap_summary=gap["summary"],
-                recommended_actions_json=recommended_actions_json
-            )
-            db.add(gap_record)
+        gap_rows = [
+            {
+                "scan_id": scan.id,
+                "requirement_id": gap["requirement_id"],
+                "gap_summary": gap["summary"],
+                "recommended_actions_json": _normalize_recommended_actions(gap.get("recommended_actions", []))
+            }
+            for gap in scan_results["gaps"]
+        ]
+        if gap_rows:
+            db.execute(Gap.__table__.insert(), gap_rows)
         
-        # Update scan status
-        scan.status = 'completed'
-        scan.progress_percentage = 100
-        scan.current_step = 'Scan completed'
-        scan.processed_requirements = len(requirements)
-        db.commit()
+        # Update scan status; commits together with the results and gaps above
+        _update_scan_progress(
+            db, scan.id, 100, 'Scan completed',
+            status='completed',
+            processed_requirements=len(requirements)
+        )
 
         logger.info(f"Compliance scan {scan_id} completed successfully")
         
@@ -241,11 +272,10 @@ def process_scan(self, scan_id: str):
         
     except Exception as e:
         logger.error(f"Error processing scan {scan_id}: {str(e)}")
-        # Update scan status to failed
-        scan.status = 'failed'
-        scan.current_step = f'Error: {str(e)[:100]}'
-        db.commit()
         db.rollback()
+        _mark_scan_failed(scan_id, e)
+        if isinstance(e, _PERMANENT_ERRORS):
+            raise
         raise self.retry(exc=e, countdown=60, max_retries=3)
     finally:
         db.close()
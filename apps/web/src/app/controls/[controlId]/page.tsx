@@ -53,7 +53,7 @@ interface ScanResult {
     maturity_level: number;
   };
   outcome: string;
-  confidence: string;
+  confidence: number;
   rationale: string;
   citations: Array<{
     document_id: string;
@@ -533,7 +533,7 @@ export default function ControlDetailPage() {
                             </span>
                           </div>
                           <p className="text-sm text-gray-600 mb-2">
-                            Confidence: {Math.round(parseFloat(result.confidence) * 100)}%
+                            Confidence: {Math.round(result.confidence * 100)}%
                           </p>
                           <p className="text-sm text-gray-700 mb-3">{result.rationale}</p>
                           {result.citations.length > 0 && (
@@ -193,11 +193,14 @@ CREATE INDEX IF NOT EXISTS idx_documents_org_id ON documents(org_id);
 CREATE INDEX IF NOT EXISTS idx_document_pages_document_id ON document_pages(document_id);
 CREATE INDEX IF NOT EXISTS idx_evidence_links_org_id ON evidence_links(org_id);
 CREATE INDEX IF NOT EXISTS idx_evidence_links_control_id ON evidence_links(control_id);
+CREATE INDEX IF NOT EXISTS idx_evidence_links_org_control ON evidence_links(org_id, control_id);
+CREATE INDEX IF NOT EXISTS idx_evidence_links_dedup ON evidence_links(document_id, control_id, requirement_id);
 CREATE INDEX IF NOT EXISTS idx_document_control_links_document_id ON document_control_links(document_id);
 CREATE INDEX IF NOT EXISTS idx_document_control_links_control_id ON document_control_links(control_id);
 CREATE INDEX IF NOT EXISTS idx_document_control_links_confidence ON document_control_links(confidence);
 CREATE INDEX IF NOT EXISTS idx_scans_org_id ON scans(org_id);
 CREATE INDEX IF NOT EXISTS idx_scans_control_id ON scans(control_id);
+CREATE INDEX IF NOT EXISTS idx_scans_control_created ON scans(control_id, created_at DESC);
 CREATE INDEX IF NOT EXISTS idx_scans_status ON scans(status);
 CREATE INDEX IF NOT EXISTS idx_scan_results_scan_id ON scan_results(scan_id);
 CREATE INDEX IF NOT EXISTS idx_gaps_scan_id ON gaps(scan_id);
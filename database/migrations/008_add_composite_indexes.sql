@@ -0,0 +1,12 @@
+-- Add composite indexes for the hottest filter columns
+-- Migration: 008_add_composite_indexes.sql
+
+-- Control listing per framework and requirement lookup per control
+CREATE INDEX IF NOT EXISTS idx_controls_framework_id ON controls(framework_id);
+CREATE INDEX IF NOT EXISTS idx_requirements_control_id ON requirements(control_id);
+
+-- Scan history per control, newest first
+CREATE INDEX IF NOT EXISTS idx_scans_control_created ON scans(control_id, created_at DESC);
+
+-- Duplicate check when linking evidence to a control/requirement
+CREATE INDEX IF NOT EXISTS idx_evidence_links_dedup ON evidence_links(document_id, control_id, requirement_id);
@@ -0,0 +1,20 @@
+-- Store the dual vision validation flag as a native boolean
+-- Migration: 009_settings_boolean_dual_vision.sql
+
+-- Databases whose settings table was created from the ORM models got an integer (0/1)
+-- column; the SQL schema already uses BOOLEAN, in which case this is a no-op
+DO $$
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'settings'
+          AND column_name = 'use_dual_vision_validation'
+          AND data_type <> 'boolean'
+    ) THEN
+        ALTER TABLE settings ALTER COLUMN use_dual_vision_validation DROP DEFAULT;
+        ALTER TABLE settings
+            ALTER COLUMN use_dual_vision_validation TYPE BOOLEAN
+            USING use_dual_vision_validation::integer <> 0;
+        ALTER TABLE settings ALTER COLUMN use_dual_vision_validation SET DEFAULT false;
+    END IF;
+END $$;
@@ -0,0 +1,17 @@
+-- Store scan result confidence as a number
+-- Migration: 010_scan_result_numeric_confidence.sql
+
+-- 003_add_scanning_tables.sql created the column as VARCHAR(10); match the init schema
+DO $$
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'scan_results'
+          AND column_name = 'confidence'
+          AND data_type = 'character varying'
+    ) THEN
+        ALTER TABLE scan_results
+            ALTER COLUMN confidence TYPE DECIMAL(3,2)
+            USING confidence::numeric;
+    END IF;
+END $$;
@@ -0,0 +1,25 @@
+-- Store scan results, gaps and audit metadata as JSONB
+-- Migration: 011_scan_json_columns_jsonb.sql
+
+-- 003_add_scanning_tables.sql created these columns as TEXT holding JSON documents;
+-- the init schema already uses JSONB, in which case nothing is changed
+DO $$
+DECLARE
+    col RECORD;
+BEGIN
+    FOR col IN
+        SELECT table_name, column_name FROM information_schema.columns
+        WHERE (table_name, column_name) IN (
+            ('scan_results', 'rationale_json'),
+            ('scan_results', 'citations_json'),
+            ('gaps', 'recommended_actions_json'),
+            ('audit_logs', 'meta_json')
+        )
+          AND data_type = 'text'
+    LOOP
+        EXECUTE format(
+            'ALTER TABLE %I ALTER COLUMN %I TYPE JSONB USING %I::jsonb',
+            col.table_name, col.column_name, col.column_name
+        );
+    END LOOP;
+END $$;
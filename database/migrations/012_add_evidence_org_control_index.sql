@@ -0,0 +1,6 @@
+-- Serve the scan worker's evidence lookup (org_id = ? AND control_id = ?) from one index
+-- Migration: 012_add_evidence_org_control_index.sql
+
+-- CONCURRENTLY avoids blocking evidence linking while the index builds;
+-- run this file outside a transaction block (e.g. plain psql -f)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_evidence_links_org_control ON evidence_links(org_id, control_id);